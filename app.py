@@ -1,8 +1,11 @@
 import streamlit as st
 import pandas as pd
 import io
-from llm_extractor import extract_structure_from_text
-from converter import transform_to_rows
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from llm_extractor import extract_structure_from_groups, split_row_lines
+from converter import OUTPUT_COLUMNS, conversion_cache_info, convert_sheet, is_row_format, transform_items, transform_many
+import metrics
 
 st.set_page_config(page_title="CDL Cable Converter", layout="wide")
 
@@ -33,69 +36,145 @@ with col2:
         key="fire_box"
     )
 
+# -----------------------------
+# Spreadsheet BOQ (xlsx / csv): columns are read directly, no AI pass
+# -----------------------------
+uploaded_sheet = st.file_uploader(
+    "Or upload a BOQ spreadsheet (xlsx / csv):",
+    type=["xlsx", "csv"],
+    key="sheet_file"
+)
+sheet_is_fire = st.checkbox("Spreadsheet starts with fire cables", value=False)
+
 # Convert button
 #st.markdown("---")
 
-if st.button(" Convert", use_container_width=True):
+show_timings = st.checkbox("Show timings (debug)", value=False)
 
-    all_rows = []
+if st.button(" Convert", use_container_width=True):
 
-    def safe_unit(u):
-        u = (u or "").strip()
-        return u if u else "M"   # default; you can change to "ROLL" if you prefer
+    all_columns = {name: [] for name in OUTPUT_COLUMNS}
+
+    def add_columns(columns):
+        for name in OUTPUT_COLUMNS:
+            all_columns[name].extend(columns[name])
+
+    def convert_box(raw_text, is_fire, previous):
+        # Runs in a worker thread: no st.* calls in here
+        # Complete ROW FORMAT lines are converted directly; only the
+        # rest (block format, messy text) goes through the LLM.
+        # previous: {segment: (columns, skipped)} of this box's last run,
+        # one segment per row line or block; only segments that are new or
+        # edited since then are extracted (all in one call) and converted
+        # again, the rest is spliced back in from there.
+        # Lines that fail to convert are skipped one by one and returned
+        # (skipped) instead of failing the whole box.
+        segments = split_row_lines(raw_text, is_row_format)
+        changed = [segment for segment in dict.fromkeys(segments) if segment not in previous]
+        llm_texts = [text for kind, text in changed if kind == "text"]
+
+        # One extraction for all of them (chunked, concurrency capped),
+        # items handed back to their own text in order
+        items, exact = extract_structure_from_groups(llm_texts)
+        extracted = dict(zip(llm_texts, items))
+
+        # LLM items keep their structured quantity (transform_items);
+        # HARD OVERRIDE: the box decides fire / standard, not the LLM
+        results = {}
+        for segment in changed:
+            kind, text = segment
+            skipped = []
+            if kind == "row":
+                part = transform_many(
+                    [text], force_fire=is_fire,
+                    on_error=lambda line, e: skipped.append(f"{line} ({e})"),
+                )
+            else:
+                part = transform_items(
+                    extracted[text], force_fire=is_fire,
+                    on_error=lambda item, e: skipped.append(f"{item.get('raw_text') or item.get('description')} ({e})"),
+                )
+            results[segment] = part, skipped
+
+        metrics.emit("app.segments_reused", len(segments) - len(changed))
+        metrics.emit("app.segments_converted", len(changed))
+
+        # Only keep LLM results that can be trusted on a later run: no
+        # empty extractions (usually a bad completion) and no batch whose
+        # items could not be matched exactly to their blocks
+        def keep(segment):
+            kind, text = segment
+            return kind == "row" or (exact and extracted[text])
+
+        columns = {name: [] for name in OUTPUT_COLUMNS}
+        skipped = []
+        current = {}
+        for segment in segments:
+            if segment in results:
+                part, part_skipped = results[segment]
+                if keep(segment):
+                    current[segment] = part, part_skipped
+            else:
+                part, part_skipped = current[segment] = previous[segment]
+            for name in OUTPUT_COLUMNS:
+                columns[name].extend(part[name])
+            skipped.extend(part_skipped)
+
+        return columns, skipped, current
 
     # -----------------------------
-    # Standard cables (AI Structured)
+    # Standard (never fire) + Fire (always fire) boxes, AI Structured.
+    # Both boxes are extracted and converted concurrently; results and
+    # errors are reported in box order.
     # -----------------------------
-    if standard_input.strip():
-        try:
-            structured_items = extract_structure_from_text(standard_input)
-
-            for item in structured_items:
-                # HARD OVERRIDE: standard box must never convert as fire
-                item["is_fire_section"] = False
-
-                unit = safe_unit(item.get("unit"))
-                desc = (item.get("description") or "").strip()
-                qty = item.get("quantity")
-
-                if not desc or qty is None:
+    boxes = [
+        ("Standard", standard_input, False),
+        ("Fire", fire_input, True),
+    ]
+
+    # Per box results of the last run, for incremental re-conversion
+    last_runs = st.session_state.setdefault("last_runs", {})
+
+    # Timings of this session only: other sessions convert in the same process
+    timings = metrics.recording(scoped=True) if show_timings else nullcontext()
+    with timings as recorder:
+        with metrics.timed("app.convert_seconds"), ThreadPoolExecutor(max_workers=len(boxes)) as pool:
+            futures = [
+                (label, pool.submit(metrics.in_context(convert_box), raw_text, is_fire, last_runs.get(label, {})))
+                for label, raw_text, is_fire in boxes
+                if raw_text.strip()
+            ]
+
+            for label, future in futures:
+                try:
+                    columns, skipped, last_runs[label] = future.result()
+                    add_columns(columns)
+                except Exception as e:
+                    st.error(f"AI extraction failed ({label}): {e}")
                     continue
-
-                synthetic_line = f"{desc} {unit} {qty}"
-                all_rows.extend(transform_to_rows(synthetic_line, force_fire=False))
-
-        except Exception as e:
-            st.error(f"AI extraction failed (Standard): {e}")
+                if skipped:
+                    st.warning(f"{len(skipped)} line(s) skipped ({label}):\n\n" + "\n\n".join(skipped))
+
+        if uploaded_sheet is not None:
+            try:
+                with metrics.timed("app.sheet_seconds"):
+                    sheet_df = convert_sheet(uploaded_sheet, force_fire=sheet_is_fire)
+                add_columns({name: sheet_df[name].tolist() for name in OUTPUT_COLUMNS})
+            except Exception as e:
+                st.error(f"Spreadsheet conversion failed: {e}")
+
+        if all_columns["Text"]:
+            with metrics.timed("app.dataframe_seconds"):
+                df = pd.DataFrame(all_columns)
+                df = df[OUTPUT_COLUMNS]
+            st.dataframe(df, use_container_width=True, hide_index=True)
+        else:
+            st.info("No valid lines detected.")
 
     # -----------------------------
-    # Fire cables (AI Structured)
+    # Debug panel: where the seconds went
     # -----------------------------
-    if fire_input.strip():
-        try:
-            structured_items = extract_structure_from_text(fire_input)
-
-            for item in structured_items:
-                # HARD OVERRIDE: fire box must always convert as fire
-                item["is_fire_section"] = True
-
-                unit = safe_unit(item.get("unit"))
-                desc = (item.get("description") or "").strip()
-                qty = item.get("quantity")
-
-                if not desc or qty is None:
-                    continue
-
-                synthetic_line = f"{desc} {unit} {qty}"
-                all_rows.extend(transform_to_rows(synthetic_line, force_fire=True))
-
-        except Exception as e:
-            st.error(f"AI extraction failed (Fire): {e}")
-
-    if all_rows:
-        df = pd.DataFrame(all_rows)
-        df = df[["Text", "Item", "Hareb Code", "Quantity"]]
-        st.dataframe(df, use_container_width=True, hide_index=True)
-    else:
-        st.info("No valid lines detected.")
-
+    if recorder is not None:
+        with st.expander("⏱ Timings", expanded=True):
+            st.dataframe(pd.DataFrame(recorder.summary()), use_container_width=True, hide_index=True)
+            st.caption(f"Conversion cache: {conversion_cache_info()}")
@@ -0,0 +1,652 @@
+"""
+Benchmark harness for the converter and the LLM extraction path.
+
+Generates synthetic BOQ corpora covering every format parse_line supports
+and measures lines/sec and peak Python memory (tracemalloc) per stage.
+Results are printed as JSON so runs can be diffed between commits.
+
+    python benchmark.py --lines 1000 10000 100000 --output bench.json
+    python benchmark.py --lines 1000 --stages transform llm
+    python benchmark.py --import-budget
+    python benchmark.py --check-golden
+    python benchmark.py --check-json-repair
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import converter
+
+# =========================================================
+# CORPUS
+# =========================================================
+
+SIZES = [1.5, 2.5, 4, 6, 10, 16, 25, 35, 50, 70, 95, 120, 150, 185, 240]
+COLORS = ["red", "yellow", "black", "blue", "brown", "grey", "white", "yellow/green"]
+UNITS = ["m", "ML", "LM", "MR"]
+
+
+def _size(rng):
+    return converter.format_size(rng.choice(SIZES))
+
+
+def _qty(rng):
+    return rng.choice([rng.randint(1, 1500), round(rng.uniform(1, 1500), 1)])
+
+
+# One generator per supported format
+FORMATS = {
+    "inner_x": lambda r: f"Cable ({r.randint(2, 5)}X{_size(r)}mm2) {r.choice(UNITS)} {_qty(r)}",
+    "vj": lambda r: f"VJ {_size(r)}mm LM {_qty(r)}",
+    "2c6": lambda r: f"Size ({r.randint(2, 5)}C{_size(r)}) mm2 ML {_qty(r)}",
+    "plus_e": lambda r: f"{r.randint(2, 4)}C {_size(r)}mm² + E = {_size(r)}mm² {r.choice(UNITS)} {_qty(r)}",
+    "4x6": lambda r: f"{r.randint(2, 5)} x {_size(r)}mm2 {r.choice(UNITS)} {_qty(r)}",
+    "single_size": lambda r: f"{_size(r)} mm2 {r.choice(COLORS)} {_qty(r)} lm",
+    "sc": lambda r: f"{r.randint(1, 5)}{r.choice(['SC', 'C'])}, {_size(r)} MR {_qty(r)}",
+    "cat6": lambda r: f"CAT6 UTP cable m {_qty(r)}",
+    "nyz": lambda r: f"NYZ {r.randint(2, 4)}x{_size(r)} m {_qty(r)}",
+    "3xa_b": lambda r: f"3x{r.choice([50, 70, 95, 120, 150])}+{r.choice([25, 35])} mm2 m {_qty(r)}",
+    "fire": lambda r: f"Fire resistant {r.randint(2, 5)}x{_size(r)} m {_qty(r)}",
+}
+
+SECTION_HEADERS = ["Cu/PVC cables", "Cu/XLPE/SWA cables", "Fire resistant cables"]
+
+
+def generate_corpus(n_lines, seed=0, section_every=200):
+    """
+    Return n_lines of synthetic BOQ text, cycling through every format with
+    a section header (standard / fire) every section_every lines.
+    """
+    rng = random.Random(seed)
+    makers = list(FORMATS.values())
+    lines = []
+    for i in range(n_lines):
+        if section_every and i % section_every == 0:
+            lines.append(rng.choice(SECTION_HEADERS))
+        else:
+            lines.append(rng.choice(makers)(rng))
+    return lines
+
+
+# =========================================================
+# STUB LLM SERVER
+# =========================================================
+
+class _StubLLMHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible /chat/completions endpoint: every input line
+    with a trailing number comes back as one item.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        text = body["messages"][-1]["content"]
+        items = []
+        for line in text.splitlines():
+            m = re.search(r"(\d+(?:\.\d+)?)\s*$", line)
+            if m and not line.startswith("Extract"):
+                items.append({
+                    "description": line[:m.start()].strip(),
+                    "raw_text": line,
+                    "size_text": None,
+                    "color": None,
+                    "unit": None,
+                    "quantity": float(m.group(1)),
+                    "is_fire_section": False,
+                })
+        payload = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": json.dumps(items)},
+            }],
+            "usage": {"prompt_tokens": len(text) // 4, "completion_tokens": len(items) * 30, "total_tokens": 0},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubLLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# =========================================================
+# STAGES
+# =========================================================
+
+def bench_transform(lines):
+    for line in lines:
+        if converter.is_new_cable_section(line):
+            continue
+        try:
+            converter.transform_to_rows(line, force_fire=False)
+        except ValueError:
+            pass
+
+
+def bench_transform_many(lines):
+    converter.transform_many(lines, track_sections=True, on_error=lambda line, e: None)
+
+
+def bench_convert_series(lines):
+    import pandas as pd
+
+    # Spreadsheet-like columns: the line without its trailing quantity + the quantity
+    descriptions, quantities = [], []
+    for line in lines:
+        match = converter.TRAILING_NUMBER_RE.search(line)
+        descriptions.append(line[:match.start()] if match else line)
+        quantities.append(match.group() if match else None)
+    converter.convert_series(pd.Series(descriptions), pd.Series(quantities), on_error=lambda line, e: None)
+
+
+def bench_convert_text_file(lines):
+    data = "\n".join(lines).encode("utf-8")
+    converter.convert_text_file(io.BytesIO(data))
+
+
+def bench_export_to_excel(lines):
+    with tempfile.TemporaryDirectory() as tmp:
+        converter.export_to_excel(lines, os.path.join(tmp, "bench.xlsx"))
+
+
+def bench_export_stream(lines):
+    with tempfile.TemporaryDirectory() as tmp:
+        converter.export_rows(lines, os.path.join(tmp, "bench.xlsx"))
+
+
+def bench_llm(lines, server):
+    import llm_extractor
+
+    llm_extractor.configure_client(base_url=f"http://127.0.0.1:{server.server_port}/v1", api_key="stub")
+    # The stub has no provider limits
+    llm_extractor.scheduler = llm_extractor.RequestScheduler(requests_per_min=0, tokens_per_min=0)
+    llm_extractor.extract_structure_from_text("\n".join(lines), cache=False)
+
+
+def _broken_llm_response(lines):
+    """
+    A large, malformed model response: fenced, raw newlines/tabs inside
+    strings, and cut off mid-object so the salvage path runs.
+    """
+    parts = []
+    for i, line in enumerate(lines):
+        desc = line.replace('"', "'")
+        if i % 3 == 0:
+            desc = desc.replace(" ", "\n", 1)
+        if i % 5 == 0:
+            desc += "\t"
+        parts.append(
+            '{"description": "%s", "raw_text": "%s", "size_text": null, "color": null,'
+            ' "unit": "m", "quantity": %d, "is_fire_section": false}' % (desc, desc, i + 1)
+        )
+    body = ",\n".join(parts)
+    return "```json\n[" + body[: len(body) - 40] + "\n```"
+
+
+def bench_json_repair(lines):
+    import llm_extractor
+
+    content = _broken_llm_response(lines)
+    llm_extractor.parse_items(content)
+
+
+STAGES = {
+    "transform": bench_transform,
+    "transform_many": bench_transform_many,
+    "convert_series": bench_convert_series,
+    "convert_text_file": bench_convert_text_file,
+    "export_to_excel": bench_export_to_excel,
+    "export_stream": bench_export_stream,
+    "json_repair": bench_json_repair,
+    "llm": bench_llm,
+}
+
+
+def measure(stage, lines, **kwargs):
+    converter.clear_conversion_cache()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            STAGES[stage](lines, **kwargs)
+        finally:
+            sys.stdout = stdout
+    elapsed = time.perf_counter() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "stage": stage,
+        "lines": len(lines),
+        "seconds": round(elapsed, 4),
+        "lines_per_sec": round(len(lines) / elapsed, 1) if elapsed else None,
+        "peak_mem_mb": round(peak / 1e6, 2),
+    }
+
+
+# =========================================================
+# IMPORT TIME
+# =========================================================
+
+# Cold import budget per module (ms, cumulative -X importtime). Short-lived
+# batch workers and the CLI import only these; pandas / numpy / openai /
+# streamlit must stay out of their import graph.
+IMPORT_BUDGETS_MS = {
+    "converter": 40,
+    "cli": 50,
+    "llm_extractor": 50,
+}
+HEAVY_MODULES = ("pandas", "numpy", "openai", "streamlit")
+
+
+def measure_import(module):
+    """
+    Import module in a fresh interpreter with -X importtime.
+    Returns its cumulative import time (ms) and the heavy modules it pulled in.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    total_us = None
+    loaded = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not cumulative_us.isdigit():
+            continue  # header line
+        if name == module:
+            total_us = int(cumulative_us)
+        top = name.split(".")[0]
+        if top in HEAVY_MODULES:
+            loaded.add(top)
+    return {
+        "module": module,
+        "import_ms": round(total_us / 1000, 2) if total_us is not None else None,
+        "budget_ms": IMPORT_BUDGETS_MS.get(module),
+        "heavy_modules": sorted(loaded),
+    }
+
+
+def check_import_budgets(repeat=3):
+    """
+    Best of `repeat` cold imports per module. Returns (results, ok).
+    """
+    results = []
+    for module in IMPORT_BUDGETS_MS:
+        runs = [measure_import(module) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["import_ms"])
+        best["ok"] = best["import_ms"] <= best["budget_ms"] and not best["heavy_modules"]
+        results.append(best)
+    return results, all(r["ok"] for r in results)
+
+
+# =========================================================
+# BLOCK ITEM COUNTS
+# =========================================================
+
+# (paste, items the model should return): the app only keeps LLM results
+# per block when each block got exactly this many items
+BLOCK_COUNT_CASES = [
+    ("Cable NYA 4mm2\n1 Red Roll 5\n2 Yellow Roll 5", 2),
+    ("NYM 4x16 mm2 m 100", 1),
+    ("Cable NYA 6mm2\n1 Red 100\n2 Blue 50\n3 Black 20", 3),
+    ("Fire resistant cables\nCable 2x1.5mm2\nRoll\n3", 1),
+]
+
+
+def _prompt_block_example():
+    """The BLOCK FORMAT example of SYSTEM_PROMPT (two items)."""
+    import llm_extractor
+
+    example = llm_extractor.SYSTEM_PROMPT.split("B) BLOCK FORMAT (VERY IMPORTANT):\nExample:\n", 1)[1]
+    return example.split("\nRules for BLOCK FORMAT", 1)[0].strip()
+
+
+def check_block_counts():
+    """
+    Expected item counts of llm_extractor._expected_items on the prompt's own
+    BLOCK FORMAT example and BLOCK_COUNT_CASES. Returns (results, ok).
+    """
+    import llm_extractor
+
+    results = []
+    for text, expected in [(_prompt_block_example(), 2)] + BLOCK_COUNT_CASES:
+        counted = llm_extractor._expected_items(text)
+        results.append({"text": text, "expected": expected, "counted": counted, "ok": counted == expected})
+    return results, all(r["ok"] for r in results)
+
+
+# =========================================================
+# GOLDEN EQUIVALENCE
+# =========================================================
+
+# converter.py before the rules table (user-021) and the Hareb catalog
+# (user-022): transform_to_rows / parse_line must still match it
+GOLDEN_REF = "b8b4687"
+
+# Wider than SIZES on purpose: sub-1 mm2, off-catalog and comma decimals
+GOLDEN_SIZES = SIZES + [0.5, 0.75, 1, 300, 400, 630]
+GOLDEN_COLORS = COLORS + ["RD", "BK", "green-yellow", "orange", ""]
+GOLDEN_UNITS = UNITS + ["M", "Roll", "ROLL ROLL", "lm", ""]
+
+
+def _golden_size(rng):
+    size = converter.format_size(rng.choice(GOLDEN_SIZES))
+    return size.replace(".", ",") if rng.random() < 0.2 else size
+
+
+def _golden_line(rng):
+    c, s, u, col, q = (
+        rng.randint(1, 7), _golden_size(rng), rng.choice(GOLDEN_UNITS), rng.choice(GOLDEN_COLORS), _qty(rng),
+    )
+    return rng.choice([
+        lambda: f"Cable ({c}X{s}mm2) {u} {q}",
+        lambda: f"VJ {s}mm LM {q}",
+        lambda: f"Size ({c}C{s}) mm2 ML {q}",
+        lambda: f"{c}C {s}mm² + E = {_golden_size(rng)}mm² {u} {q}",
+        lambda: f"{c} x {s}mm2 {col} {u} {q}",
+        lambda: f"{c}x{s} {u} {q}",
+        lambda: f"{s} mm2 {col} {q} lm",
+        lambda: f"{c}SC, {s} MR {q}",
+        lambda: f"{c}C, {s} M {q}",
+        lambda: f"CAT6 UTP cable {u} {q}",
+        lambda: f"NYZ {c}x{s} {u} {q}",
+        lambda: f"3x{_golden_size(rng)}+{_golden_size(rng)} mm2 {u} {q}",
+        lambda: f"3 x {_golden_size(rng)}, {_golden_size(rng)} {u} {q}",
+        lambda: f"Fire resistant {c}x{s} {u} {q}",
+        lambda: f"FR cable {c}x{s}+PE {_golden_size(rng)} {q}",
+        lambda: f"{c}x{s}+{_golden_size(rng)} {u} {q}",
+        lambda: f"NYA {s}mm {col} Roll {q}",
+        lambda: f"{c}X{s}mm {col} CEI {q}",
+        lambda: f"single {s} {col}",
+        lambda: rng.choice(SECTION_HEADERS),
+        lambda: "random text with no numbers",
+        lambda: "",
+    ])()
+
+
+def _git_show(ref, path):
+    return subprocess.run(
+        ["git", "show", f"{ref}:{path}"],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+
+
+def _reference_converter(ref):
+    """converter.py as of git revision ref, loaded as a separate module."""
+    import types
+
+    module = types.ModuleType("converter_reference")
+    sys.modules[module.__name__] = module
+    exec(compile(_git_show(ref, "converter.py"), f"{ref}:converter.py", "exec"), module.__dict__)
+    return module
+
+
+def _outcome(func, *args, **kwargs):
+    # Comparable result: JSON-shaped value, or ["ERR", type, message]
+    try:
+        return json.loads(json.dumps(func(*args, **kwargs)))
+    except Exception as e:
+        return ["ERR", type(e).__name__, str(e)]
+
+
+SUB_1MM2_RE = re.compile(r"(?<![\d.,])0[.,]\d")
+
+
+def _expected_change(line, reference, current):
+    """
+    Why current may differ from reference on line (user-022), or None:
+    - "catalog": off-catalog sizes / cores now raise instead of inventing a code
+    - "sub_1mm2": codes below 1 mm2 keep their decimals (0.5 → "0.5", not "0")
+    """
+    if (
+        current[:1] == ["ERR"] and current[2].startswith("Not in the Hareb catalog")
+        and reference[:1] != ["ERR"]
+        and any(row["Hareb Code"] not in converter.CATALOG_CODES for row in reference)
+    ):
+        return "catalog"
+    if (
+        SUB_1MM2_RE.search(line)
+        and reference[:1] != ["ERR"] and current[:1] != ["ERR"] and len(reference) == len(current)
+        and all(
+            {k: v for k, v in a.items() if k != "Hareb Code"} == {k: v for k, v in b.items() if k != "Hareb Code"}
+            for a, b in zip(reference, current)
+        )
+    ):
+        return "sub_1mm2"
+    return None
+
+
+def check_golden(n_lines=20000, seed=0, ref=GOLDEN_REF):
+    """
+    Compare transform_to_rows (force_fire False / True / None) and parse_line
+    with converter.py at ref on n_lines generated lines. Differences named by
+    _expected_change are counted, anything else is a mismatch.
+    Returns (summary, mismatches).
+    """
+    reference = _reference_converter(ref)
+    rng = random.Random(seed)
+    counts = {"cases": 0, "equal": 0, "catalog": 0, "sub_1mm2": 0}
+    mismatches = []
+
+    for _ in range(n_lines):
+        line = _golden_line(rng)
+        cases = [(f"transform_to_rows(force_fire={ff})", "transform_to_rows", {"force_fire": ff})
+                 for ff in (False, True, None)]
+        cases.append(("parse_line", "parse_line", {}))
+        for label, name, kwargs in cases:
+            counts["cases"] += 1
+            expected = _outcome(getattr(reference, name), line, **kwargs)
+            got = _outcome(getattr(converter, name), line, **kwargs)
+            if got == expected:
+                counts["equal"] += 1
+                continue
+            change = _expected_change(line, expected, got)
+            if change:
+                counts[change] += 1
+            else:
+                mismatches.append({"line": line, "call": label, "reference": expected, "current": got})
+
+    counts["mismatches"] = len(mismatches)
+    return {"ref": ref, "lines": n_lines, "seed": seed, **counts}, mismatches
+
+
+# =========================================================
+# JSON REPAIR EQUIVALENCE
+# =========================================================
+
+# The per-character repair helpers the regex rewrite (user-012) replaced
+JSON_REPAIR_FUNCTIONS = (
+    "_strip_code_fences", "_extract_json_array",
+    "_sanitize_json_control_chars", "_extract_top_level_json_objects",
+)
+
+# Fragments malformed model output is made of
+JSON_FRAGMENTS = [
+    "{", "}", "[", "]", '"', "\\", '\\"', "\\n", "\n", "\r", "\t", "\x00", "\x1f", "\x7f",
+    ",", ":", " ", "a", "é", "5", "null", "true", "```", "```json",
+    '"quantity": ', '"description": "', '"items": [',
+    '{"description": "2x1.5 red", "quantity": 12}',
+    '{"raw_text": "Cable\n 4x16\tm", "quantity": "3.5", "unit": "m"}',
+]
+
+
+def _reference_json_repair(ref):
+    """The JSON repair helpers of llm_extractor.py at ref (the module itself needs openai)."""
+    import ast
+
+    source = _git_show(ref, "llm_extractor.py")
+    tree = ast.parse(source)
+    tree.body = [node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name in JSON_REPAIR_FUNCTIONS]
+    namespace = {"json": json, "re": re}
+    exec(compile(tree, f"{ref}:llm_extractor.py", "exec"), namespace)
+    return namespace
+
+
+def _reference_parse_items(repair, content):
+    # The parse steps of extract_structure_from_text at GOLDEN_REF
+    import llm_extractor
+
+    content = repair["_extract_json_array"](repair["_strip_code_fences"](content))
+    content = repair["_sanitize_json_control_chars"](content)
+    try:
+        items = json.loads(content)
+    except json.JSONDecodeError:
+        items = []
+        for obj_txt in repair["_extract_top_level_json_objects"](content):
+            try:
+                items.append(json.loads(repair["_sanitize_json_control_chars"](obj_txt)))
+            except Exception:
+                continue
+    if isinstance(items, dict):
+        items = items["items"] if isinstance(items.get("items"), list) else []
+    if not isinstance(items, list):
+        items = []
+    return [item for item in map(llm_extractor._clean_item, items) if item is not None]
+
+
+def _fuzz_response(rng):
+    return "".join(rng.choice(JSON_FRAGMENTS) for _ in range(rng.randint(0, 40)))
+
+
+def check_json_repair(n_inputs=200000, seed=0, ref=GOLDEN_REF):
+    """
+    Compare the JSON repair path with the per-character version at ref on
+    n_inputs random malformed responses: the sanitizer, the salvage scanner
+    and parse_items (items cleaned by the current _clean_item on both sides).
+    Returns (summary, mismatches).
+    """
+    import llm_extractor
+
+    repair = _reference_json_repair(ref)
+    rng = random.Random(seed)
+    checks = [
+        ("_sanitize_json_control_chars", repair["_sanitize_json_control_chars"],
+         llm_extractor._sanitize_json_control_chars),
+        ("_extract_top_level_json_objects", repair["_extract_top_level_json_objects"],
+         llm_extractor._extract_top_level_json_objects),
+        ("parse_items", lambda content: _reference_parse_items(repair, content), llm_extractor.parse_items),
+    ]
+    mismatches = []
+    for _ in range(n_inputs):
+        content = _fuzz_response(rng)
+        for name, reference, current in checks:
+            expected = _outcome(reference, content)
+            got = _outcome(current, content)
+            if got != expected:
+                mismatches.append({"input": content, "call": name, "reference": expected, "current": got})
+
+    summary = {"ref": ref, "inputs": n_inputs, "seed": seed, "cases": n_inputs * len(checks),
+               "mismatches": len(mismatches)}
+    return summary, mismatches
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the BOQ converter.")
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000, 10000],
+                        help="corpus sizes to run (e.g. 1000 100000 1000000)")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--import-budget", action="store_true",
+                        help="only check cold import times against IMPORT_BUDGETS_MS (exit 1 if over)")
+    parser.add_argument("--check-blocks", action="store_true",
+                        help="only check LLM block item counts on BLOCK_COUNT_CASES (exit 1 on a mismatch)")
+    parser.add_argument("--check-golden", type=int, nargs="?", const=20000, metavar="LINES",
+                        help=f"only compare conversions with converter.py at --golden-ref on LINES generated "
+                             f"lines (default 20000; exit 1 on an unexpected difference)")
+    parser.add_argument("--check-json-repair", type=int, nargs="?", const=200000, metavar="INPUTS",
+                        help="only compare the LLM JSON repair path with llm_extractor.py at --golden-ref "
+                             "on INPUTS random malformed responses (default 200000; exit 1 on a difference)")
+    parser.add_argument("--golden-ref", default=GOLDEN_REF,
+                        help=f"git revision for --check-golden / --check-json-repair ({GOLDEN_REF})")
+    args = parser.parse_args(argv)
+
+    if args.import_budget:
+        results, ok = check_import_budgets()
+        print(json.dumps({"commit": _git_commit(), "python": sys.version.split()[0], "imports": results}, indent=2))
+        return 0 if ok else 1
+
+    if args.check_blocks:
+        results, ok = check_block_counts()
+        print(json.dumps({"commit": _git_commit(), "blocks": results}, indent=2))
+        return 0 if ok else 1
+
+    if args.check_golden:
+        summary, mismatches = check_golden(args.check_golden, seed=args.seed, ref=args.golden_ref)
+        print(json.dumps({"commit": _git_commit(), "golden": summary, "mismatches": mismatches[:20]}, indent=2))
+        return 0 if not mismatches else 1
+
+    if args.check_json_repair:
+        summary, mismatches = check_json_repair(args.check_json_repair, seed=args.seed, ref=args.golden_ref)
+        print(json.dumps({"commit": _git_commit(), "json_repair": summary, "mismatches": mismatches[:20]}, indent=2))
+        return 0 if not mismatches else 1
+
+    # Import pandas up front: the first stage using it must not be charged for the import
+    import pandas  # noqa: F401
+
+    server = start_stub_server() if "llm" in args.stages else None
+    results = []
+    try:
+        for n in args.lines:
+            lines = generate_corpus(n, seed=args.seed)
+            for stage in args.stages:
+                kwargs = {"server": server} if stage == "llm" else {}
+                results.append(measure(stage, lines, **kwargs))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Headless batch converter: BOQ files or directories in, Hareb code files out.
+
+    python cli.py boq.txt                          # → boq_converted.xlsx
+    python cli.py boqs/ --format csv --workers 4 --output-dir out/
+    python cli.py boqs/ -r -o out/                 # boqs/a/x.txt → out/a/x_converted.xlsx
+    python cli.py fire_boq.txt --fire always
+
+Text files (.txt) are converted line by line; spreadsheets (.xlsx / .csv)
+through their description / unit / quantity columns (see convert_sheet).
+Only converter is imported (no streamlit / openai), so the runner starts
+fast in cron jobs and containers. --workers converts several files in
+parallel, or splits a single text file across processes. Ends with a
+throughput summary; the exit code is 1 if any file failed. Inputs that
+would write the same output file (e.g. boq.txt and boq.csv) are refused
+before anything is converted.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import converter
+
+TEXT_SUFFIXES = (".txt",)
+SHEET_SUFFIXES = (".xlsx", ".xlsm", ".csv")
+
+# How fire / standard is decided:
+# - sections: section headers in the file switch modes (starts standard)
+# - always / never: every row is fire / standard, headers are skipped
+FIRE_MODES = ("sections", "always", "never")
+
+OUTPUT_SUFFIX = "_converted"
+
+
+def find_inputs(paths, recursive=False):
+    """
+    Input files from file and directory arguments, in a stable order.
+    Yields (file, directory it was found in or None for file arguments).
+    Files we wrote (*_converted.*) are skipped when scanning directories.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path, None
+            continue
+
+        if recursive:
+            found = [os.path.join(root, name) for root, _dirs, names in os.walk(path) for name in names]
+        else:
+            found = [os.path.join(path, name) for name in os.listdir(path)]
+
+        for file in sorted(found):
+            stem, suffix = os.path.splitext(os.path.basename(file))
+            if suffix.lower() in TEXT_SUFFIXES + SHEET_SUFFIXES and not stem.endswith(OUTPUT_SUFFIX):
+                yield file, path
+
+
+def output_path(path, fmt, output_dir=None, scanned_dir=None):
+    """
+    Where a converted file goes: next to its input, or under output_dir
+    with the input's subdirectories (relative to scanned_dir) mirrored.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    directory = os.path.dirname(path)
+    if output_dir:
+        directory = output_dir
+        if scanned_dir is not None:
+            directory = os.path.normpath(os.path.join(output_dir, os.path.relpath(os.path.dirname(path), scanned_dir)))
+    return os.path.join(directory, f"{stem}{OUTPUT_SUFFIX}.{fmt}")
+
+
+def find_collisions(jobs):
+    """
+    (first input, other input, output) for every output written twice.
+    """
+    seen = {}
+    for path, output_file, *_ in jobs:
+        key = os.path.normcase(os.path.abspath(output_file))
+        if key in seen:
+            yield seen[key], path, output_file
+        else:
+            seen[key] = path
+
+
+def convert_file(path, output_file, fmt, fire="sections", verbose=False, workers=1):
+    """
+    Convert one file. Returns its stats: file, output, lines, rows, skipped,
+    seconds and error (None if the file converted).
+    workers > 1 splits a text file into shards converted in that many
+    processes (converter.transform_parallel); sheets are read by one process.
+    """
+    stats = {"file": path, "output": output_file, "lines": 0, "rows": 0, "skipped": 0, "seconds": 0.0, "error": None}
+    force_fire = fire == "always"
+    track_sections = fire == "sections"
+
+    def on_error(line, error):
+        stats["skipped"] += 1
+        if verbose:
+            print(f"Skipped: {path}: {line} | Error: {error}", file=sys.stderr)
+
+    start = time.perf_counter()
+    try:
+        if os.path.splitext(path)[1].lower() in SHEET_SUFFIXES:
+            sheet_stats = {}
+            stats["rows"] = converter.export_sheet(
+                path, output_file, fmt,
+                force_fire=force_fire, track_sections=track_sections, on_error=on_error, stats=sheet_stats,
+            )
+            stats["lines"] = sheet_stats["sheet_rows"]
+        else:
+            with open(path, "rb") as f:
+                lines = _counted(converter.iter_text_lines(f), stats)
+                if not track_sections:
+                    lines = (line for line in lines if line.strip() and not converter.is_new_cable_section(line))
+                stats["rows"] = converter.export_rows(
+                    lines, output_file, fmt,
+                    force_fire=force_fire, track_sections=track_sections, on_error=on_error, workers=workers,
+                )
+    except Exception as e:
+        stats["error"] = f"{type(e).__name__}: {e}"
+        # No half-written output next to the good ones
+        if os.path.exists(output_file):
+            os.remove(output_file)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def _counted(lines, stats):
+    for line in lines:
+        stats["lines"] += 1
+        yield line
+
+
+def _convert_file_args(args):
+    return convert_file(*args)
+
+
+def print_summary(results, elapsed, out=sys.stdout):
+    lines = sum(r["lines"] for r in results)
+    rows = sum(r["rows"] for r in results)
+    skipped = sum(r["skipped"] for r in results)
+    failed = [r for r in results if r["error"]]
+
+    for r in failed:
+        print(f"❌ {r['file']}: {r['error']}", file=out)
+
+    rate = lines / elapsed if elapsed else 0.0
+    print(
+        f"{len(results) - len(failed)}/{len(results)} files, {lines} lines → {rows} rows, "
+        f"{skipped} skipped, {elapsed:.2f}s ({rate:,.0f} lines/sec)",
+        file=out,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert BOQ files to Hareb codes without the app.")
+    parser.add_argument("paths", nargs="+", help="BOQ files (.txt / .xlsx / .csv) or directories")
+    parser.add_argument("-o", "--output-dir", help="where to write results (default: next to each input)")
+    parser.add_argument("-f", "--format", choices=converter.EXPORT_FORMATS, default="xlsx")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="processes: files are converted in parallel; a single .txt file is split across them")
+    parser.add_argument("--fire", choices=FIRE_MODES, default="sections",
+                        help="sections: headers switch fire / standard; always / never: force the mode")
+    parser.add_argument("-r", "--recursive", action="store_true", help="also scan subdirectories")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every skipped line")
+    args = parser.parse_args(argv)
+
+    inputs = list(find_inputs(args.paths, args.recursive))
+    if not inputs:
+        parser.error("no BOQ files found")
+    jobs = [
+        (path, output_path(path, args.format, args.output_dir, scanned_dir), args.format, args.fire, args.verbose)
+        for path, scanned_dir in inputs
+    ]
+
+    # Parallel jobs writing the same file would overwrite each other
+    collisions = [f"{a} and {b} both write {out}" for a, b, out in find_collisions(jobs)]
+    if collisions:
+        parser.error("output name collision: " + "; ".join(collisions))
+
+    for output_dir in sorted({os.path.dirname(job[1]) for job in jobs}):
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    if args.workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(_convert_file_args, jobs))
+    else:
+        results = [convert_file(*job, workers=args.workers) for job in jobs]
+    elapsed = time.perf_counter() - start
+
+    print_summary(results, elapsed)
+    return 1 if any(r["error"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
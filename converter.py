@@ -1,5 +1,16 @@
+import csv
+import io
+import os
 import re
-import pandas as pd
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain, islice
+from types import MappingProxyType
+from typing import Callable, NamedTuple, Optional, Union
+
+import metrics
 
 ROLL_LENGTH = 92
 
@@ -60,163 +71,207 @@ def row_contains_fire(text: str) -> bool:
 # =========================================================
 # PARSER
 # =========================================================
+# All format patterns are compiled once at import. parse_line() checks a
+# cheap substring prefilter before each pattern so a line only pays for the
+# regexes that can possibly match it. Order of the patterns is unchanged.
+
+NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+FIRE_KEYWORD_RE = re.compile(r"\b(fire|fr|resistant|cei)\b", re.IGNORECASE)
+
+# PRIORITY PATTERN: (4X150mm2)
+PATTERN_INNER_X = re.compile(
+    r'\(\s*(?P<cores>\d+)\s*[xX]\s*'
+    r'(?P<power>\d+(?:\.\d+)?)\s*mm?2?\s*\)'
+    r'.*?(?P<length>\d+(?:\.\d+)?)$',
+    re.IGNORECASE
+)
+
+# VJ EARTH FORMAT: "VJ 120mm LM 75"
+PATTERN_VJ = re.compile(
+    r'\bVJ\b\s*(?P<size>\d+(?:\.\d+)?)\s*(?:mm2|mm²|mm)?\b',
+    re.IGNORECASE
+)
+
+# NEW FORMAT: Size (2C6) mm2 ML 20
+PATTERN_PARENTHESIS = re.compile(
+    r'\(\s*(?P<cores>\d+)\s*[cC]\s*(?P<power>\d+(?:\.\d+)?)\s*\)'
+    r'.*?(?P<length>\d+(?:\.\d+)?)$',
+    re.IGNORECASE
+)
+
+# EXISTING +E FORMAT: 4C 16mm² + E = 16mm² 50
+PATTERN_PLUS_E = re.compile(
+    r'(?P<cores>\d+)\s*[cC]\s*'
+    r'(?P<power>\d+(?:\.\d+)?)\s*mm²'
+    r'(?:\s*\+\s*E\s*=\s*(?P<earth>\d+(?:\.\d+)?)\s*mm²)?'
+    r'.*?(?P<length>\d+(?:\.\d+)?)$',
+    re.IGNORECASE
+)
+
+# SIMPLE 4x6 FORMAT
+PATTERN_SIMPLE = re.compile(
+    r'(?P<cores>\d+)\s*[xX]\s*'
+    r'(?P<power>\d+(?:\.\d+)?)',
+    re.IGNORECASE
+)
+
+# SINGLE SIZE FORMAT: 70 mm2 178 lm
+PATTERN_SINGLE_SIZE = re.compile(
+    r'(?P<power>\d+(?:\.\d+)?)\s*mm(?:2|²)?\b'
+    r'.*?'
+    r'(?P<length>\d+(?:\.\d+)?)\s*(?:lm|ml|m)?\s*$',
+    re.IGNORECASE
+)
+
+# SC / C FORMAT: 4SC, 240 MR 50  OR  4C, 10 MR 20
+PATTERN_SC = re.compile(
+    r'^\s*(?P<cores>\d+)\s*S?C\s*,\s*'
+    r'(?P<power>\d+(?:\.\d+)?)\s*'
+    r'(?:MR|ML|M)?\s*'
+    r'(?P<length>\d+(?:\.\d+)?)\s*$',
+    re.IGNORECASE
+)
+
+
+def _parsed(text, cores, power_size, earth_size, length, is_fire, is_vj=False):
+    return {
+        "raw_text": text,
+        "cores": cores,
+        "power_size": power_size,
+        "earth_size": earth_size,
+        "length": length,
+        "is_fire": is_fire,
+        "is_vj": is_vj
+    }
+
+
 def parse_line(text: str):
     text = text.strip()
     # -----------------------------------------------------
     # Extract quantity (last numeric value in line)
     # -----------------------------------------------------
-    qty_match = re.findall(r'\d+(?:\.\d+)?', text)
-    
+    qty_match = NUMBER_RE.findall(text)
+
     if not qty_match:
         raise ValueError(f"No numeric quantity found: {text}")
 
     length = float(qty_match[-1])
 
     # Detect fire cable
-    is_fire = bool(re.search(r"\b(fire|fr|resistant|cei)\b", text, re.IGNORECASE))
+    is_fire = bool(FIRE_KEYWORD_RE.search(text))
+
+    # Prefilter: every pattern below needs one of these markers
+    lower = text.lower()
+    has_x = "x" in lower
+    has_c = "c" in lower
+    has_paren = "(" in text
 
     # -----------------------------------------------------
     # PRIORITY PATTERN: (4X150mm2)
     # Always extract inner X format first
     # -----------------------------------------------------
-    pattern_inner_x = (
-        r'\(\s*(?P<cores>\d+)\s*[xX]\s*'
-        r'(?P<power>\d+(?:\.\d+)?)\s*mm?2?\s*\)'
-        r'.*?(?P<length>\d+(?:\.\d+)?)$'
-    )
-    
-    match = re.search(pattern_inner_x, text, re.IGNORECASE)
-    if match:
-        return {
-            "raw_text": text,
-            "cores": int(match.group("cores")),
-            "power_size": float(match.group("power")),
-            "earth_size": None,
-            "length": float(match.group("length")),
-            "is_fire": is_fire,
-            "is_vj": False
-        }
+    if has_x and has_paren:
+        match = PATTERN_INNER_X.search(text)
+        if match:
+            return _parsed(
+                text,
+                int(match.group("cores")),
+                float(match.group("power")),
+                None,
+                float(match.group("length")),
+                is_fire,
+            )
 
     # -----------------------------------------------------
     # VJ EARTH FORMAT: "VJ 120mm LM 75"  => earth cable
     # -----------------------------------------------------
-    pattern_vj = r'\bVJ\b\s*(?P<size>\d+(?:\.\d+)?)\s*(?:mm2|mm²|mm)?\b'
-    m = re.search(pattern_vj, text, re.IGNORECASE)
-    if m:
-        return {
-            "raw_text": text,
-            "cores": 1,
-            "power_size": float(m.group("size")),
-            "earth_size": None,
-            "length": length,
-            "is_fire": is_fire,
-            "is_vj": True,   # <-- add this flag
-        }
+    if "vj" in lower:
+        match = PATTERN_VJ.search(text)
+        if match:
+            return _parsed(
+                text,
+                1,
+                float(match.group("size")),
+                None,
+                length,
+                is_fire,
+                is_vj=True,
+            )
+
     # -----------------------------------------------------
     # NEW FORMAT: Size (2C6) mm2 ML 20
     # -----------------------------------------------------
-    pattern_parenthesis = (
-        r'\(\s*(?P<cores>\d+)\s*[cC]\s*(?P<power>\d+(?:\.\d+)?)\s*\)'
-        r'.*?(?P<length>\d+(?:\.\d+)?)$'
-    )
-
-    match = re.search(pattern_parenthesis, text, re.IGNORECASE)
-    if match:
-        return {
-            "raw_text": text,
-            "cores": int(match.group("cores")),
-            "power_size": float(match.group("power")),
-            "earth_size": None,
-            "length": float(match.group("length")),
-            "is_fire": is_fire,
-            "is_vj": False
-        }
+    if has_c and has_paren:
+        match = PATTERN_PARENTHESIS.search(text)
+        if match:
+            return _parsed(
+                text,
+                int(match.group("cores")),
+                float(match.group("power")),
+                None,
+                float(match.group("length")),
+                is_fire,
+            )
 
     # -----------------------------------------------------
     # EXISTING +E FORMAT
     # -----------------------------------------------------
-    pattern_plus_e = (
-        r'(?P<cores>\d+)\s*[cC]\s*'
-        r'(?P<power>\d+(?:\.\d+)?)\s*mm²'
-        r'(?:\s*\+\s*E\s*=\s*(?P<earth>\d+(?:\.\d+)?)\s*mm²)?'
-        r'.*?(?P<length>\d+(?:\.\d+)?)$'
-    )
-
-    match = re.search(pattern_plus_e, text, re.IGNORECASE)
-    if match:
-        return {
-            "raw_text": text,
-            "cores": int(match.group("cores")),
-            "power_size": float(match.group("power")),
-            "earth_size": float(match.group("earth")) if match.group("earth") else None,
-            "length": float(match.group("length")),
-            "is_fire": is_fire,
-            "is_vj": False
-        }
+    if has_c and "mm²" in lower:
+        match = PATTERN_PLUS_E.search(text)
+        if match:
+            return _parsed(
+                text,
+                int(match.group("cores")),
+                float(match.group("power")),
+                float(match.group("earth")) if match.group("earth") else None,
+                float(match.group("length")),
+                is_fire,
+            )
 
     # -----------------------------------------------------
     # SIMPLE 4x6 FORMAT
     # -----------------------------------------------------
-    pattern_simple = (
-        r'(?P<cores>\d+)\s*[xX]\s*'
-        r'(?P<power>\d+(?:\.\d+)?)'
-    )
-
-    match = re.search(pattern_simple, text, re.IGNORECASE)
-    if match:
-        return {
-            "raw_text": text,
-            "cores": int(match.group("cores")),
-            "power_size": float(match.group("power")),
-            "earth_size": None,
-            "length": length,
-            "is_fire": is_fire,
-            "is_vj": False
-        }
+    if has_x:
+        match = PATTERN_SIMPLE.search(text)
+        if match:
+            return _parsed(
+                text,
+                int(match.group("cores")),
+                float(match.group("power")),
+                None,
+                length,
+                is_fire,
+            )
 
-    
     # -----------------------------------------------------
     # SINGLE SIZE FORMAT: 70 mm2 178 lm
     # -----------------------------------------------------
-    pattern_single_size = (
-        r'(?P<power>\d+(?:\.\d+)?)\s*mm(?:2|²)?\b'
-        r'.*?'
-        r'(?P<length>\d+(?:\.\d+)?)\s*(?:lm|ml|m)?\s*$'
-    )
-    
-    match = re.search(pattern_single_size, text, re.IGNORECASE)
-    if match:
-        return {
-            "raw_text": text,
-            "cores": 1,  # assume single core
-            "power_size": float(match.group("power")),
-            "earth_size": None,
-            "length": float(match.group("length")),
-            "is_fire": is_fire,
-            "is_vj": False
-        }
+    if "mm" in lower:
+        match = PATTERN_SINGLE_SIZE.search(text)
+        if match:
+            return _parsed(
+                text,
+                1,  # assume single core
+                float(match.group("power")),
+                None,
+                float(match.group("length")),
+                is_fire,
+            )
+
     # -----------------------------------------------------
     # SC / C FORMAT: 4SC, 240 MR 50  OR  4C, 10 MR 20
     # -----------------------------------------------------
-    pattern_sc = re.search(
-        r'^\s*(?P<cores>\d+)\s*S?C\s*,\s*'
-        r'(?P<power>\d+(?:\.\d+)?)\s*'
-        r'(?:MR|ML|M)?\s*'
-        r'(?P<length>\d+(?:\.\d+)?)\s*$',
-        text,
-        re.IGNORECASE
-    )
-    
-    if pattern_sc:
-        return {
-            "raw_text": text,
-            "cores": int(pattern_sc.group("cores")),
-            "power_size": float(pattern_sc.group("power")),
-            "earth_size": None,
-            "length": float(pattern_sc.group("length")),
-            "is_fire": is_fire,
-            "is_vj": False
-        }
+    if has_c and "," in text:
+        match = PATTERN_SC.search(text)
+        if match:
+            return _parsed(
+                text,
+                int(match.group("cores")),
+                float(match.group("power")),
+                None,
+                float(match.group("length")),
+                is_fire,
+            )
 
     raise ValueError(f"Cannot parse line: {text}")
 
@@ -248,17 +303,22 @@ def power_family(size, cores=None):
 
 
 
+def code_size(size):
+    # Codes carry whole mm2 (1.5 → 1); sizes below 1mm2 keep their decimals (0.75)
+    return str(int(size)) if size >= 1 else format_size(size)
+
+
 def build_power_code(cores, size):
     # Single core non-earth handled separately
     if cores == 1:
-        return f"CDL-NYA {int(size)}"
+        return f"CDL-NYA {code_size(size)}"
 
     family = power_family(size, cores)
 
     if family == "NYM":
         if size in (1.5, 2.5):
             return f"CDL-NYM {cores}X{size}RE"
-        return f"CDL-NYM {cores}X{int(size)}"
+        return f"CDL-NYM {cores}X{code_size(size)}"
 
     return f"CDL-NYY {cores}X{int(size)}SM"
 
@@ -267,355 +327,1572 @@ def build_power_code(cores, size):
 def build_earth_code(size, length):
     if size <= 6:
         rolls = round_rolls(length)
-        return f"CDL-NYA {int(size)} GN-YL", str(rolls), ""
+        return f"CDL-NYA {code_size(size)} GN-YL", str(rolls), ""
 
     return f"CDL-NYA {int(size)} GN-YL--MT", f"{length:.2f}", "m"
 
 
 # =========================================================
-# TRANSFORMATION
+# HAREB CODE CATALOG
 # =========================================================
+# Every valid Hareb code, precomputed at import from the builders above:
+# CODE_TABLE maps (family, cores, size, color) → code, so the rules look a
+# code up instead of rebuilding it, and a size outside CATALOG_SIZES is
+# rejected instead of turned into a code that does not exist.
+#
+# Families:
+# - "power":  NYM / NYY by power_family(), cores 2-5 (build_power_code)
+# - "NYA":    single core with a color code (COLOR_MAP values)
+# - "earth":  NYA GN-YL earth (build_earth_code), keyed (family, None, size, None)
+# - "NYZ", "SFC2XU": cores 1-5
+# - "NYY 3X+": 3xA+B reduced neutral, keyed (family, 3, A, B)
+# - "CAT6":   the single CAT6 box code, keyed (family, None, None, None)
+# Control cables (CONTROL_CORES) exist in power / NYZ / SFC2XU for sizes
+# up to CONTROL_MAX_SIZE.
+
+CATALOG_SIZES = (
+    0.5, 0.75, 1, 1.5, 2.5, 4, 6, 10, 16, 25, 35, 50, 70, 95, 120, 150, 185, 240, 300, 400, 500, 630,
+)
+CATALOG_CORES = (1, 2, 3, 4, 5)
+CONTROL_CORES = (7, 10, 12, 14, 16, 19, 24, 27, 30, 37, 44, 48, 52, 61)
+CONTROL_MAX_SIZE = 4
+CAT6_CODE = "NEX-CAT6UTPLSZH-GY"
+
+
+def _build_code_table():
+    table = {("CAT6", None, None, None): CAT6_CODE}
+    colors = set(COLOR_MAP.values())
+
+    for size in CATALOG_SIZES:
+        size = float(size)
+        table[("earth", None, size, None)] = build_earth_code(size, 0)[0]
+        for color in colors:
+            table[("NYA", 1, size, color)] = f"CDL-NYA {format_size(size)} {color}"
+
+        cores_range = CATALOG_CORES + CONTROL_CORES if size <= CONTROL_MAX_SIZE else CATALOG_CORES
+        for cores in cores_range:
+            if cores > 1:
+                table[("power", cores, size, None)] = build_power_code(cores, size)
+            table[("NYZ", cores, size, None)] = f"CDL-NYZ {cores}X{format_size(size)}"
+            table[("SFC2XU", cores, size, None)] = f"CDL-SFC2XU {cores}X{format_size(size)} --CEI"
+
+        # 3xA+B: only if B < A and A > 35
+        if size > 35:
+            for earth in CATALOG_SIZES:
+                if earth < size:
+                    table[("NYY 3X+", 3, size, float(earth))] = (
+                        f"CDL-NYY 3X{format_size(size)}+{format_size(earth)}SM"
+                    )
+
+    return MappingProxyType(table)
+
+
+CODE_TABLE = _build_code_table()
+CATALOG_CODES = frozenset(CODE_TABLE.values())
+
+# Optional ERP item list (see set_erp_items); None = every catalog code is accepted
+ERP_ITEMS = None
+
+
+def hareb_code(family, cores, size, color=None):
+    """
+    O(1) catalog lookup of a Hareb code.
+    Raises ValueError for combinations outside the catalog (e.g. a 7mm2
+    size) and, when an ERP item list is set, for codes not in it.
+    """
+    key = (family, cores, float(size) if size is not None else None, color)
+    code = CODE_TABLE.get(key)
+    if code is None:
+        shape = f"{cores}X{format_size(size)}" if cores is not None else format_size(size)
+        raise ValueError(f"Not in the Hareb catalog: {family} {shape}{' ' + str(color) if color else ''}")
+    if ERP_ITEMS is not None and code not in ERP_ITEMS:
+        raise ValueError(f"Hareb code not in the ERP item list: {code}")
+    return code
 
-def transform_to_rows(original_text, force_fire=False):
+
+def set_erp_items(codes):
     """
-    Returns a list of output rows (dicts) using ONLY these columns:
-    - Item
-    - Hareb Code
-    - Quantity
+    Only accept codes in the ERP item list (any iterable of Hareb codes,
+    e.g. a column of the ERP export); None accepts the whole catalog again.
+    Lines whose code is not in the list then fail like unparsable lines.
+    Returns the catalog codes missing from the list.
+    """
+    global ERP_ITEMS
+    ERP_ITEMS = frozenset(code.strip() for code in codes) if codes is not None else None
+    # Cached templates were checked against the old list
+    clear_conversion_cache()
+    if ERP_ITEMS is None:
+        return frozenset()
+    return CATALOG_CODES - ERP_ITEMS
+
+
+# =========================================================
+# TRANSFORMATION
+# =========================================================
+
+OUTPUT_COLUMNS = ["Text", "Item", "Hareb Code", "Quantity"]
+
+# Upper bound on distinct lines remembered by the batch normalizer
+NORMALIZE_MEMO_SIZE = 50_000
 
-    Priority order (as per your rules):
-    FIRE → CAT6 → NYZ → 3xA+B locked → parse → 5x → +number split → single core → normal power → earth split
+DECIMAL_COMMA_RE = re.compile(r'(\d+),(\d+)')
+REPEATED_ROLL_RE = re.compile(r'\bROLL\b(?:\s+\bROLL\b)+', re.IGNORECASE)
+MM_SIZE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*mm\b', re.IGNORECASE)
+WHITESPACE_RE = re.compile(r"\s+")
+
+PLUS_NUMBER_RE = re.compile(
+    r'(\d+)\s*[xX]\s*(\d+(?:\.\d+)?)\s*\+\s*(?:PE|E)?\s*(\d+(?:\.\d+)?)',
+    re.IGNORECASE
+)
+
+THREE_X_PLUS_RE = re.compile(
+    r'3\s*[xX]\s*'
+    r'(?P<A>\d+(?:\.\d+)?)\s*'
+    r'\+\s*'
+    r'(?P<B>\d+(?:\.\d+)?)(?:\s*mm?2)?',
+    re.IGNORECASE
+)
+
+COLOR_RE = re.compile(
+    r'\b(red|yellow|black|blue|brown|grey|gray|white|orange|rd|yl|bk|bl|bu|br|gy|wt|or)\b'
+)
+
+
+def normalize_text(original_text):
+    """
+    Normalize a raw BOQ line before the rules run:
+    - European decimal comma to dot (2,5 → 2.5)
+    - repeated ROLL words collapsed ("ROLL ROLL" → "ROLL")
+    - "mm" sizes rewritten as "mm2" ("6mm Green" → "6 mm2 Green")
     """
-    rows = []
     text = (original_text or "").strip()
-    # Convert European decimal comma to dot (e.g., 2,5 → 2.5)
-    text = re.sub(r'(\d+),(\d+)', r'\1.\2', text)
+    text = DECIMAL_COMMA_RE.sub(r'\1.\2', text)
     if not text:
-        return rows
-    # Remove repeated ROLL words: "ROLL ROLL" -> "ROLL"
-    text = re.sub(r'\bROLL\b(?:\s+\bROLL\b)+', 'ROLL', text, flags=re.IGNORECASE)
-    
-    # Optional: normalize "mm" to "mm2" when it looks like size (e.g., "6mm Green" -> "6mm2 Green")
-    text = re.sub(r'(\d+(?:\.\d+)?)\s*mm\b', r'\1 mm2', text, flags=re.IGNORECASE)
-    text_lower = text.lower()
+        return text
+    text = REPEATED_ROLL_RE.sub('ROLL', text)
+    text = MM_SIZE_RE.sub(r'\1 mm2', text)
+    return text
+
+
+# Explicit unit + quantity at the end of a row: "... m 80", "... MR 50", "... 178 lm"
+ROW_QUANTITY_RE = re.compile(
+    r'(?:\b(?:m|ml|lm|mr|mtr|meters?|metres?|rolls?)\s*\d+(?:\.\d+)?'
+    r'|\s\d+(?:\.\d+)?\s*(?:m|ml|lm|mr))\s*$',
+    re.IGNORECASE
+)
+
+
+def is_row_format(line: str) -> bool:
+    """
+    True if the line is a complete ROW FORMAT item ("3 x 4mm2 m 80", "4SC, 240 MR 50")
+    that the rules convert directly: explicit unit + quantity at the end and a
+    size parse_line understands. Such lines do not need the LLM.
+    """
+    text = normalize_text(line)
+    if not text or not ROW_QUANTITY_RE.search(text):
+        return False
+
+    if "cat6" in text.lower():
+        return True
+
+    try:
+        parse_line(text)
+    except ValueError:
+        return False
+    return True
+
+
+def extract_last_number_as_length(s: str) -> float:
+    """
+    Last numeric value in line = quantity.
+    (Used by CAT6 and 3xA+B locked rule pre-parse)
+    """
+    nums = NUMBER_RE.findall(s)
+    if not nums:
+        return 0.0
+    return float(nums[-1])
+
+
+# Quantity rules of a resolved row
+QTY_METERS = "m"            # length in meters, 2 decimals
+QTY_EARTH = "earth"         # build_earth_code(): rolls up to 6mm2, meters above
+QTY_CAT6_ROLLS = "cat6"     # 305 m boxes, always rounded up
+
+
+# =========================================================
+# RULE TABLE
+# =========================================================
+# Every rule is data:
+# - keywords: trigger, lowercase substrings one of which must be in the line
+#   (() = tried on every line)
+# - extract: callable(line) → the rule's fields (always with "length"),
+#   or None when the rule does not apply to the line
+# - rows: one RuleRow per output row: the catalog family and the fields
+#   holding its cores / size / 4th key part; the code is looked up with
+#   hareb_code() when the rule is applied
+#
+# Lines are dispatched through a keyword index (RuleIndex): one scan finds
+# every rule keyword in the line, and only the rules it triggers plus the
+# keyword-less ones are tried, in table order. A new cable family adds a
+# keyword, not another check on every line.
+
+class Rule(NamedTuple):
+    name: str
+    keywords: tuple
+    extract: Callable
+    rows: tuple
+
+
+class RuleRow(NamedTuple):
+    family: str
+    quantity: str
+    cores: Optional[str] = "cores"
+    size: Optional[str] = "size"
+    extra: Optional[str] = None     # NYA color / 3xA+B neutral size
+    optional: bool = False          # left out when its size field is empty
+
+
+# Earth split: NYA GN-YL for the "earth" size, if the line has one
+EARTH_ROW = RuleRow("earth", QTY_EARTH, cores=None, size="earth", optional=True)
+
+
+class _Line:
+    """
+    A line being resolved. parse_line() and the power fields run at most
+    once per line, however many rules look at them.
+    """
+    __slots__ = ("text", "lower", "_data", "_power")
+
+    def __init__(self, text):
+        self.text = text
+        self.lower = text.lower()
+        self._data = None
+        self._power = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = _parse(self.text)
+        return self._data
+
+    @property
+    def power(self):
+        """
+        (cores, size, earth, length) after the 5x and +number rules.
+        """
+        if self._power is None:
+            data = self.data
+            cores = data["cores"]
+            size = data["power_size"]
+            earth = data["earth_size"]
+
+            # 5X RULE → 4 power + 1 earth (split)
+            if cores == 5 and earth is None:
+                earth = size
+                cores = 4
+
+            # +NUMBER SPLIT RULE (4x10+10 etc.), PE/E keyword optional
+            plus_match = PLUS_NUMBER_RE.search(self.text)
+            if plus_match:
+                cores = int(plus_match.group(1))
+                size = float(plus_match.group(2))
+                earth = float(plus_match.group(3))
+
+            self._power = (cores, size, earth, data["length"])
+        return self._power
+
+
+def _extract_fire(line):
+    # Parse for cores/size/earth/length where possible
+    data = line.data
+    cores = data["cores"]
+    size = data["power_size"]
+    earth = data["earth_size"]
+
+    # Re-detect +number inside fire case (e.g., 4x6 + PE 6)
+    plus_match = PLUS_NUMBER_RE.search(line.text)
+    if plus_match:
+        cores = int(plus_match.group(1))
+        size = float(plus_match.group(2))
+        earth = float(plus_match.group(3))
+
+    # If fire cable includes earth → split earth with NYA rule
+    return {"length": data["length"], "cores": cores, "size": size, "earth": earth}
+
+
+def _extract_cat6(line):
+    return {"length": extract_last_number_as_length(line.text)}
+
+
+def _extract_nyz(line):
+    data = line.data
+    return {"length": data["length"], "cores": data["cores"], "size": data["power_size"]}
+
+
+def _extract_three_x_plus(line):
+    # Accept comma or plus between A and B; only if B < A and A > 35
+    match = THREE_X_PLUS_RE.search(WHITESPACE_RE.sub(" ", line.text.replace(",", "+")))
+    if match is None:
+        return None
+
+    a = float(match.group("A"))
+    b = float(match.group("B"))
+    if not (b < a and a > 35):
+        return None
+
+    return {"length": extract_last_number_as_length(line.text), "cores": 3, "size": a, "neutral": b}
+
+
+def _extract_single_core_earth(line):
+    # Yellow/Green (checked BEFORE normal colors), or no color at all → GN-YL earth rule
+    cores, size, _earth, length = line.power
+    if cores != 1:
+        return None
+    if not any(k in line.lower for k in ["yellow/green", "yellow-green", "green/yellow", "green-yellow"]):
+        if COLOR_RE.search(line.lower):
+            return None
+    return {"length": length, "earth": size}
+
+
+def _extract_single_core_color(line):
+    cores, size, _earth, length = line.power
+    if cores != 1:
+        return None
+    color_match = COLOR_RE.search(line.lower)
+    if color_match is None:
+        return None
+
+    key = color_match.group(1).lower()
+    return {"length": length, "cores": 1, "size": size, "color": COLOR_MAP.get(key, key.upper())}
+
+
+def _extract_power(line):
+    cores, size, earth, length = line.power
+    return {"length": length, "cores": cores, "size": size, "earth": earth}
+
+
+FIRE_RULE = Rule("fire", (), _extract_fire, (RuleRow("SFC2XU", QTY_METERS), EARTH_ROW))
+
+# Priority order (as per your rules), after FIRE:
+# CAT6 → NYZ → 3xA+B locked → single core → normal power + earth split (5x / +number)
+RULES = (
+    Rule("cat6", ("cat6",), _extract_cat6, (RuleRow("CAT6", QTY_CAT6_ROLLS, cores=None, size=None),)),
+    Rule("nyz", ("nyz",), _extract_nyz, (RuleRow("NYZ", QTY_METERS),)),
+    Rule("3xA+B", ("+", ","), _extract_three_x_plus, (RuleRow("NYY 3X+", QTY_METERS, extra="neutral"),)),
+    Rule("single core earth", (), _extract_single_core_earth, (EARTH_ROW,)),
+    Rule("single core", (), _extract_single_core_color, (RuleRow("NYA", QTY_METERS, extra="color"),)),
+    Rule("power", (), _extract_power, (RuleRow("power", QTY_METERS), EARTH_ROW)),
+)
+
+
+class RuleIndex:
+    """
+    Keyword index over a rule table: candidates(text_lower) returns the rules
+    to try for a line, in table order, after a single scan for all keywords.
+    """
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        keywords = sorted({k for rule in self.rules for k in rule.keywords}, key=len, reverse=True)
+        self._scan = re.compile("|".join(map(re.escape, keywords))) if keywords else None
+        self._by_keyword = {
+            k: {i for i, rule in enumerate(self.rules) if k in rule.keywords}
+            for k in keywords
+        }
+        self._always = {i for i, rule in enumerate(self.rules) if not rule.keywords}
+        # found keywords → candidate rules (at most 2^len(keywords) entries)
+        self._candidates = {}
+
+    def candidates(self, text_lower):
+        found = frozenset(self._scan.findall(text_lower)) if self._scan else frozenset()
+        rules = self._candidates.get(found)
+        if rules is None:
+            indexes = set(self._always)
+            for k in found:
+                indexes |= self._by_keyword[k]
+            rules = tuple(self.rules[i] for i in sorted(indexes))
+            self._candidates[found] = rules
+        return rules
+
+
+RULE_INDEX = RuleIndex(RULES)
+
+
+def _apply_rule(rule, fields):
+    out = []
+    for row in rule.rows:
+        size = fields[row.size] if row.size else None
+        if row.optional and not size:
+            continue
+        code = hareb_code(
+            row.family,
+            fields[row.cores] if row.cores else None,
+            size,
+            fields[row.extra] if row.extra else None,
+        )
+        out.append((code, row.quantity, size if row.quantity == QTY_EARTH else None))
+    return fields["length"], tuple(out)
+
+
+def _resolve_normalized(text, force_fire=False):
+    """
+    Apply the conversion rules to an already normalized, non-empty line.
+    Returns (length, template) where template is a tuple of
+    (Hareb Code, quantity rule, earth size) entries; see _quantity().
+
+    FIRE (Highest Priority), then the first rule of RULES that applies.
+    HARD OVERRIDE:
+    - force_fire=True  => always fire
+    - force_fire=False => never fire (even if keywords exist)
+    - force_fire=None  => keyword detection allowed (only if you ever use None)
+    """
+    line = _Line(text)
 
-    # -----------------------------------------------------
-    # Helper: last numeric value in line = quantity
-    # (Used by CAT6 and 3xA+B locked rule pre-parse)
-    # -----------------------------------------------------
-    def extract_last_number_as_length(s: str) -> float:
-        nums = re.findall(r"\d+(?:\.\d+)?", s)
-        if not nums:
-            return 0.0
-        return float(nums[-1])
-
-    # =====================================================
-    # 1️⃣ FIRE RULE (Highest Priority)
-    # - fire can come from force_fire OR "fire/fr/resistant/cei" in the row itself OR parsed flag
-    # =====================================================
-    # Note: we still parse for fire rows so we can reuse your existing parsing logic.
-    # But we determine fire intent first so it works with section-headers (force_fire=True).
-    # HARD OVERRIDE:
-    # - force_fire=True  => always fire
-    # - force_fire=False => never fire (even if keywords exist)
-    # - force_fire=None  => keyword detection allowed (only if you ever use None)
     if force_fire is True:
         fire_intent = True
     elif force_fire is False:
         fire_intent = False
     else:
-        fire_intent = bool(re.search(r"\b(fire|fr|resistant|cei)\b", text_lower, re.IGNORECASE))
-        
-    if fire_intent:
-        data = parse_line(text)  # get cores/size/earth/length where possible
-
-        cores = data["cores"]
-        size = data["power_size"]
-        earth = data["earth_size"]
-        length = data["length"]
-
-        # Re-detect +number inside fire case (e.g., 4x6 + PE 6)
-        plus_match = re.search(
-            r'(\d+)\s*[xX]\s*(\d+(?:\.\d+)?)\s*\+\s*(?:PE|E)?\s*(\d+(?:\.\d+)?)',
-            text,
-            re.IGNORECASE
-        )
-        if plus_match:
-            cores = int(plus_match.group(1))
-            size = float(plus_match.group(2))
-            earth = float(plus_match.group(3))
+        fire_intent = bool(FIRE_KEYWORD_RE.search(line.lower))
 
-        rows.append({
-            "Text": text,
-            "Item":"item",
-            "Hareb Code": f"CDL-SFC2XU {cores}X{format_size(size)} --CEI",
-            "Quantity": f"{length:.2f}",
-        })
+    rules = (FIRE_RULE,) if fire_intent else RULE_INDEX.candidates(line.lower)
+    start = time.perf_counter() if metrics.hooks else None
+    for rule in rules:
+        fields = rule.extract(line)
+        if fields is not None:
+            resolved = _apply_rule(rule, fields)
+            # Only runs on conversion cache misses: cached lines skip the rules
+            if start is not None:
+                metrics.emit("convert.rule_seconds", time.perf_counter() - start, rule=rule.name)
+            return resolved
 
-        # If fire cable includes earth → split earth with NYA rule
-        if earth:
-            code, qty, _unit = build_earth_code(earth, length)
-            rows.append({
-                "Text": text,
-                "Item":"item",
-                "Hareb Code": code,
-                "Quantity": qty,
-            })
-
-        return rows
-
-    # =====================================================
-    # 2️⃣ CAT6 RULE (No parse needed)
-    # =====================================================
-    if "cat6" in text_lower:
-        length = extract_last_number_as_length(text)
-        rolls = length / 305.0
-        # Always round UP, min 1
-        rolls_int = int(rolls) if float(rolls).is_integer() else int(rolls) + 1
-        rolls_int = max(rolls_int, 1)
-
-        rows.append({
-            "Text": text,
-            "Item":"item",
-            "Hareb Code": "NEX-CAT6UTPLSZH-GY",
-            "Quantity": str(rolls_int),
-        })
-        return rows
-
-    # =====================================================
-    # 3️⃣ NYZ RULE (Parse needed to get cores/size)
-    # =====================================================
-    if "nyz" in text_lower:
-        data = parse_line(text)
-        cores = data["cores"]
-        size = data["power_size"]
-        length = data["length"]
-
-        rows.append({
-            "Text": text,
-            "Item":"item",
-            "Hareb Code": f"CDL-NYZ {cores}X{format_size(size)}",
-            "Quantity": f"{length:.2f}",
-        })
-        return rows
-
-    # =====================================================
-    # 4️⃣ 3xA + B LOCKED RULE (MUST run before normal parsing logic takes over)
-    # - Accept comma or plus between A and B
-    # - Trigger only if B < A and A > 35
-    # =====================================================
-    normalized_text = re.sub(r"\s+", " ", text.replace(",", "+"))
-    
-    pattern_3x_plus = re.search(
-        r'3\s*[xX]\s*'
-        r'(?P<A>\d+(?:\.\d+)?)\s*'
-        r'\+\s*'
-        r'(?P<B>\d+(?:\.\d+)?)(?:\s*mm?2)?',
-        normalized_text,
-        re.IGNORECASE
-    )
-    
-    if pattern_3x_plus:
-        A = float(pattern_3x_plus.group("A"))
-        B = float(pattern_3x_plus.group("B"))
-    
-        if B < A and A > 35:
-            length = extract_last_number_as_length(text)
-            rows.append({
-                "Text": text,
-                "Item":"item",
-                "Hareb Code": f"CDL-NYY 3X{format_size(A)}+{format_size(B)}SM",
-                "Quantity": f"{length:.2f}",
-            })
-            return rows
-
-    # =====================================================
-    # From here onward, we parse once and apply remaining rules
-    # =====================================================
-    data = parse_line(text)
-
-    is_vj = data.get("is_vj", False)
-    cores = data["cores"]
-    size = data["power_size"]
-    earth = data["earth_size"]
-    length = data["length"]
-
-
-    
-    # =====================================================
-    # 5️⃣ 5X RULE → 4 power + 1 earth (split)
-    # =====================================================
-    if cores == 5 and earth is None:
-        earth = size
-        cores = 4
-
-    # =====================================================
-    # 6️⃣ +NUMBER SPLIT RULE (4x10+10 etc.)
-    # - Also allow PE/E keyword optionally
-    # =====================================================
-    pattern_plus_number = re.search(
-        r'(\d+)\s*[xX]\s*(\d+(?:\.\d+)?)\s*\+\s*(?:PE|E)?\s*(\d+(?:\.\d+)?)',
-        text,
-        re.IGNORECASE
-    )
+    raise ValueError(f"No rule applies to line: {text}")
 
-    if pattern_plus_number:
-        cores = int(pattern_plus_number.group(1))
-        size = float(pattern_plus_number.group(2))
-        earth = float(pattern_plus_number.group(3))
 
-    # =====================================================
-    # 7️⃣ SINGLE CORE LOGIC
-    # - If green-yellow mentioned → treat as earth rule
-    # - Else if another color abbreviation found → CDL-NYA [size] [color]
-    # - Else (no color) → treat as earth rule
-    # =====================================================
-    is_green_yellow = any(k in text_lower for k in ["yellow-green", "green-yellow", "gn-yl", "gy/yl", "g/y"])
+def cat6_rolls(length):
+    rolls = length / 305.0
+    # Always round UP, min 1
+    rolls_int = int(rolls) if float(rolls).is_integer() else int(rolls) + 1
+    return max(rolls_int, 1)
 
-    if cores == 1:
-        # IMPORTANT: handle Yellow/Green BEFORE normal colors
-        if any(k in text_lower for k in ["yellow/green", "yellow-green", "green/yellow", "green-yellow"]):
-            code, qty, _ = build_earth_code(size, length)
-            rows.append({
-                "Text": text,
-                "Item": "item",
-                "Hareb Code": code, 
-                "Quantity": qty})
-            return rows
-        
-        color_match = re.search(
-            r'\b(red|yellow|black|blue|brown|grey|gray|white|orange|rd|yl|bk|bl|bu|br|gy|wt|or)\b',
-            text_lower
-        )
-        if color_match:
-            key = color_match.group(1).lower()
-            color_code = COLOR_MAP.get(key, key.upper())
-        
-            rows.append({
-                "Text": text,
-                "Item":"item",
-                "Hareb Code": f"CDL-NYA {format_size(size)} {color_code}",
-                "Quantity": f"{length:.2f}",
-            })
-            return rows
-
-        # No color → treat as earth (GN-YL rule)
-        code, qty, _unit = build_earth_code(size, length)
-        rows.append({
+
+def _quantity_value(rule, earth_size, length):
+    """
+    Numeric quantity of a row: float meters or int rolls.
+    """
+    if rule == QTY_METERS:
+        return length
+    if rule == QTY_EARTH:
+        # Same split as build_earth_code()
+        return round_rolls(length) if earth_size <= 6 else length
+    return cat6_rolls(length)
+
+
+def format_quantity(value):
+    """
+    Export formatting of a numeric quantity: rolls as integers, meters with 2 decimals.
+    """
+    if isinstance(value, int):
+        return str(value)
+    return f"{value:.2f}"
+
+
+def _quantity(rule, earth_size, length):
+    return format_quantity(_quantity_value(rule, earth_size, length))
+
+
+def _convert_normalized(text, force_fire=False):
+    """
+    Returns a list of (Hareb Code, Quantity) pairs for a normalized line.
+    """
+    length, template = CONVERSION_CACHE.resolve(text, force_fire)
+    return [(code, _quantity(rule, earth_size, length)) for code, rule, earth_size in template]
+
+
+def _parse(text):
+    if not metrics.hooks:
+        return parse_line(text)
+    with metrics.timed("convert.parse_seconds"):
+        return parse_line(text)
+
+
+# =========================================================
+# CONVERSION CACHE
+# =========================================================
+
+# Trailing quantity of a normalized line ("4x16 mm2 M 120" → "120")
+TRAILING_NUMBER_RE = re.compile(r'(?<![\d.])\d+(?:\.\d+)?$')
+
+CONVERSION_CACHE_SIZE = 20_000
+
+_UNCACHEABLE = object()
+
+
+class ConversionCache:
+    """
+    LRU cache of the quantity-independent part of a conversion.
+
+    Key: (line with its trailing quantity masked, force_fire)
+    Value: the resolved template (codes + quantity rules); only the quantity
+    math is re-applied per line.
+
+    A line shape is cached only if the rules resolve it the same way for
+    its own quantity and for a probe quantity, and both times the length
+    is that trailing number. Otherwise (e.g. "4x16" where the last number
+    is the size) the shape is remembered as uncacheable and always goes
+    through the full rules.
+    """
+
+    def __init__(self, maxsize=CONVERSION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, text, force_fire=False):
+        match = TRAILING_NUMBER_RE.search(text)
+        if match is None or self.maxsize <= 0:
+            return _resolve_normalized(text, force_fire)
+
+        length = float(match.group())
+        key = (text[:match.start()], force_fire)
+
+        with self._lock:
+            template = self._entries.get(key)
+            if template is not None:
+                self._entries.move_to_end(key)
+                if template is not _UNCACHEABLE:
+                    self.hits += 1
+                    return length, template
+            self.misses += 1
+
+        if template is _UNCACHEABLE:
+            return _resolve_normalized(text, force_fire)
+
+        resolved = _resolve_normalized(text, force_fire)
+        self._store(key, length, resolved)
+        return resolved
+
+    def resolve_shape(self, shape, quantity, force_fire=False):
+        """
+        Template for a line shape whose quantity is already known (structured
+        items). The rules only run on a miss, on the shape plus the quantity;
+        the quantity is never parsed back out of the text.
+        """
+        text = f"{shape} {format_size(quantity)}"
+        if self.maxsize <= 0:
+            return _resolve_normalized(text, force_fire)[1]
+
+        key = (f"{shape} ", force_fire)
+        with self._lock:
+            template = self._entries.get(key)
+            if template is not None:
+                self._entries.move_to_end(key)
+                if template is not _UNCACHEABLE:
+                    self.hits += 1
+                    return template
+            self.misses += 1
+
+        resolved = _resolve_normalized(text, force_fire)
+        if template is None:
+            self._store(key, float(format_size(quantity)), resolved)
+        return resolved[1]
+
+    def _store(self, key, length, resolved):
+        probe = 7919.25 if length != 7919.25 else 1013.5
+        try:
+            probed = _resolve_normalized(f"{key[0]}{probe}", key[1])
+        except Exception:
+            probed = None
+
+        if resolved[0] == length and probed == (probe, resolved[1]):
+            template = resolved[1]
+        else:
+            template = _UNCACHEABLE
+
+        with self._lock:
+            self._entries[key] = template
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset the counters (call after changing the rules)."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+CONVERSION_CACHE = ConversionCache()
+
+
+def conversion_cache_info():
+    return CONVERSION_CACHE.info()
+
+
+def clear_conversion_cache():
+    CONVERSION_CACHE.clear()
+
+
+def transform_to_rows(original_text, force_fire=False):
+    """
+    Returns a list of output rows (dicts) using ONLY these columns:
+    - Text
+    - Item
+    - Hareb Code
+    - Quantity
+    """
+    text = normalize_text(original_text)
+    if not text:
+        return []
+
+    return [
+        {
             "Text": text,
-            "Item":"item",
+            "Item": "item",
             "Hareb Code": code,
             "Quantity": qty,
-        })
-        return rows
-
-    # =====================================================
-    # 8️⃣ NORMAL POWER
-    # =====================================================
-    power_code = build_power_code(cores, size)
-    rows.append({
-        "Text": text,
-        "Item":"item",
-        "Hareb Code": power_code,
-        "Quantity": f"{length:.2f}",
-    })
-
-    # =====================================================
-    # 9️⃣ EARTH SPLIT (from +number or 5x)
-    # =====================================================
-    if earth:
-        code, qty, _unit = build_earth_code(earth, length)
-        rows.append({
+        }
+        for code, qty in _convert_normalized(text, force_fire)
+    ]
+
+
+def transform_item(item, force_fire=None):
+    """
+    transform_to_rows for a structured item (llm_extractor output):
+    description, size_text, color, unit, quantity, is_fire_section.
+
+    The given quantity is the length; it is not re-parsed from text, so a
+    number in the description can never be taken for the quantity.
+    - force_fire: True / False override the item (e.g. the app's fire and
+      standard boxes); None uses the item's is_fire_section
+    Returns [] for items without a description or quantity.
+    """
+    resolved = _resolve_item(item, force_fire)
+    if resolved is None:
+        return []
+
+    text, length, template = resolved
+    return [
+        {
             "Text": text,
-            "Item":"item",
+            "Item": "item",
             "Hareb Code": code,
-            "Quantity": qty,
-        })
+            "Quantity": _quantity(rule, earth_size, length),
+        }
+        for code, rule, earth_size in template
+    ]
 
-    return rows
 
+def transform_items(items, force_fire=None, on_error=None):
+    """
+    Batch version of transform_item, with transform_many's columnar output.
+    - on_error: callable(item, exc) for items that fail to convert; if None the error is raised
+    """
+    columns = _empty_columns()
+    for item in items:
+        try:
+            resolved = _resolve_item(item, force_fire)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(item, e)
+            continue
+        if resolved is None:
+            continue
+
+        text, length, template = resolved
+        for code, rule, earth_size in template:
+            columns["Text"].append(text)
+            columns["Item"].append("item")
+            columns["Hareb Code"].append(code)
+            columns["Quantity"].append(_quantity(rule, earth_size, length))
+    return columns
+
+
+def _resolve_item(item, force_fire):
+    """
+    (Text, length, template) for a structured item, None if it has nothing to convert.
+    """
+    description = normalize_text(item.get("description"))
+    quantity = item.get("quantity")
+    if not description or quantity is None:
+        return None
+    length = float(quantity)
+
+    # The prompt asks for size and color inside the description; add them if the model did not
+    # (spacing ignored: "16mm2" already has size_text "16 mm2")
+    squashed = WHITESPACE_RE.sub("", description).lower()
+    for extra in (item.get("size_text"), item.get("color")):
+        extra = normalize_text(extra)
+        if extra and WHITESPACE_RE.sub("", extra).lower() not in squashed:
+            description = f"{description} {extra}"
+            squashed += WHITESPACE_RE.sub("", extra).lower()
+
+    unit = (item.get("unit") or "").strip() or "M"
+    shape = normalize_text(f"{description} {unit}")
+
+    if force_fire is None:
+        force_fire = bool(item.get("is_fire_section", False))
+
+    template = CONVERSION_CACHE.resolve_shape(shape, length, force_fire)
+    return f"{shape} {format_size(length)}", length, template
+
+
+def transform_many(lines, force_fire=False, track_sections=False, on_error=None):
+    """
+    Batch version of transform_to_rows.
+
+    Returns columnar output: {"Text": [...], "Item": [...], "Hareb Code": [...], "Quantity": [...]}
+    which can be passed straight to pd.DataFrame.
+
+    - force_fire: same meaning as in transform_to_rows (initial mode when track_sections=True)
+    - track_sections: treat cable section headers as mode switches (fire / standard) and skip them
+    - on_error: callable(line, exc) for lines that fail to convert; if None the error is raised
+    """
+    return next(iter_transform_batches(lines, None, force_fire, track_sections, on_error))
+
+
+def iter_transform_batches(lines, batch_size, force_fire=False, track_sections=False, on_error=None):
+    """
+    Generator behind transform_many. Converts lines lazily and yields columnar
+    batches of about batch_size rows (a line can add two rows, so a batch may
+    run one row over). Fire / standard section state carries across batches.
+
+    With batch_size=None everything is collected into one batch, which is
+    always yielded (even when empty).
+    """
+    columns = _empty_columns()
+
+    for text, length, template in _iter_resolved(lines, force_fire, track_sections, on_error):
+        texts = columns["Text"]
+        for code, rule, earth_size in template:
+            texts.append(text)
+            columns["Item"].append("item")
+            columns["Hareb Code"].append(code)
+            columns["Quantity"].append(_quantity(rule, earth_size, length))
+
+        if batch_size is not None and len(texts) >= batch_size:
+            yield columns
+            columns = _empty_columns()
+
+    if batch_size is None or columns["Text"]:
+        yield columns
+
+
+class Row(NamedTuple):
+    """
+    Compact output row. Text and codes are interned, and quantity stays
+    numeric (float meters / int rolls) until format_quantity() at export.
+    """
+    text: str
+    code: str
+    quantity: Union[float, int]
+
+    @property
+    def item(self):
+        return "item"
+
+    def as_dict(self):
+        """The transform_to_rows() dict for this row."""
+        return {
+            "Text": self.text,
+            "Item": "item",
+            "Hareb Code": self.code,
+            "Quantity": format_quantity(self.quantity),
+        }
+
+
+def iter_rows(lines, force_fire=False, track_sections=False, on_error=None):
+    """
+    Same conversion as transform_many, yielding one compact Row per output row.
+    """
+    for text, length, template in _iter_resolved(lines, force_fire, track_sections, on_error):
+        text = sys.intern(text)
+        for code, rule, earth_size in template:
+            yield Row(text, sys.intern(code), _quantity_value(rule, earth_size, length))
+
+
+def _iter_resolved(lines, force_fire, track_sections, on_error):
+    """
+    Shared line loop: yields (normalized text, length, template) per converted line.
+    """
+    # Repeated lines are common in BOQs: normalize each distinct line once
+    normalized = {}
+    fire_mode = force_fire
+
+    for line in lines:
+        if track_sections:
+            line = line.strip()
+            if not line:
+                continue
+
+            # -----------------------------------------
+            # Detect section change
+            # -----------------------------------------
+            if is_new_cable_section(line):
+                fire_mode = is_fire_header(line)
+                continue  # skip section headers
+
+        text = normalized.get(line)
+        if text is None:
+            if len(normalized) >= NORMALIZE_MEMO_SIZE:
+                normalized.clear()
+            text = normalize_text(line)
+            normalized[line] = text
+        if not text:
+            continue
+
+        try:
+            length, template = CONVERSION_CACHE.resolve(text, fire_mode)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(line, e)
+            continue
+
+        yield text, length, template
+
+
+def _empty_columns():
+    return {name: [] for name in OUTPUT_COLUMNS}
+
+
+def _print_skipped(line, error):
+    print(f"Skipped: {line} | Error: {error}")
 
 
 # =========================================================
-# EXPORT
+# PARALLEL
 # =========================================================
 
-def export_to_excel(input_lines, output_file="Cable_Conversion_Output.xlsx"):
-    all_rows = []
-    fire_mode = False
+# Lines per shard sent to a worker process
+SHARD_SIZE = 5_000
 
-    for line in input_lines:
+
+def iter_section_shards(lines, shard_size=SHARD_SIZE, force_fire=False, track_sections=True):
+    """
+    Split input lines into self-contained shards: (fire_mode, [lines]).
+
+    Section headers (is_new_cable_section / is_fire_header) are consumed here,
+    so every shard carries the fire / standard mode it must be converted with
+    and can be processed independently. A shard is cut at every section
+    header and whenever it reaches shard_size lines.
+    With track_sections=False headers are ordinary lines and every shard
+    uses force_fire.
+    """
+    fire_mode = force_fire
+    shard = []
+
+    for line in lines:
         line = line.strip()
         if not line:
             continue
 
-        lower_line = line.lower()
+        if track_sections and is_new_cable_section(line):
+            if shard:
+                yield fire_mode, shard
+                shard = []
+            fire_mode = is_fire_header(line)
+            continue  # skip section headers
+
+        shard.append(line)
+        if len(shard) >= shard_size:
+            yield fire_mode, shard
+            shard = []
 
-        # -----------------------------------------
-        # Detect section change
-        # -----------------------------------------
-        if is_new_cable_section(line):
+    if shard:
+        yield fire_mode, shard
 
-            if is_fire_header(line):
-                fire_mode = True
-            else:
-                fire_mode = False
 
-            continue  # skip section headers
+def _convert_shard(shard):
+    """
+    Worker entry point. Returns (columns, errors); errors are reported by the
+    parent so they come out in input order.
+    """
+    fire_mode, lines, collect_errors = shard
+    errors = []
 
-        try:
-            all_rows.extend(transform_to_rows(line, force_fire=fire_mode))
-        except Exception as e:
-            print(f"Skipped: {line} | Error: {e}")
+    def on_error(line, error):
+        errors.append((line, error))
+
+    columns = transform_many(lines, force_fire=fire_mode, on_error=on_error if collect_errors else None)
+    return columns, errors
+
+
+def transform_parallel(lines, workers=None, shard_size=SHARD_SIZE, force_fire=False, on_error=None):
+    """
+    Multiprocess version of transform_many(lines, track_sections=True).
+
+    Shards are converted in a process pool (workers=None → one per CPU) and
+    merged back in the original order. Same columnar output and on_error
+    contract as transform_many.
+    """
+    columns = _empty_columns()
+    for shard_columns in _iter_parallel_shards(lines, workers, shard_size, force_fire, True, on_error):
+        for name in OUTPUT_COLUMNS:
+            columns[name].extend(shard_columns[name])
 
-    df = pd.DataFrame(all_rows)
+    return columns
+
+
+def _iter_parallel_shards(lines, workers, shard_size, force_fire, track_sections, on_error):
+    # Converted shard columns in input order; errors reported before each shard's rows
+    from concurrent.futures import ProcessPoolExecutor
+
+    shards = (
+        (fire_mode, shard, on_error is not None)
+        for fire_mode, shard in iter_section_shards(lines, shard_size, force_fire, track_sections)
+    )
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for shard_columns, errors in pool.map(_convert_shard, shards):
+            for line, error in errors:
+                on_error(line, error)
+            yield shard_columns
+
+
+def _transform_lines(lines, workers):
+    if workers is not None and workers > 1:
+        return transform_parallel(lines, workers=workers, on_error=_print_skipped)
+    return transform_many(lines, track_sections=True, on_error=_print_skipped)
+
+
+# =========================================================
+# EXPORT
+# =========================================================
+
+EXPORT_FORMATS = ("xlsx", "csv", "parquet")
+
+# Rows converted and written per step when streaming an export
+EXPORT_BATCH_SIZE = 10_000
+
+
+def export_to_excel(input_lines, output_file="Cable_Conversion_Output.xlsx", workers=None, stream=False):
+    """
+    Convert input lines and write them to an Excel file.
+    workers > 1 converts in a process pool (see transform_parallel).
+    stream=True writes rows while converting instead of building a DataFrame
+    first (see export_rows); workers is ignored in that mode.
+    """
+    import pandas as pd
+
+    if stream:
+        export_rows(input_lines, output_file, fmt="xlsx")
+        return
+
+    columns = _transform_lines(input_lines, workers)
+
+    with metrics.timed("convert.dataframe_seconds"):
+        df = pd.DataFrame(columns)
     df.to_excel(output_file, index=False)
 
     print(f"✅ Excel file created: {output_file}")
 
 
+def export_rows(input_lines, output_file, fmt=None, batch_size=EXPORT_BATCH_SIZE,
+                force_fire=False, track_sections=True, on_error=_print_skipped, workers=None):
+    """
+    Streaming export: rows are written as they are converted (compact Rows,
+    quantities formatted only here), so memory stays bounded.
+
+    fmt: "xlsx" (openpyxl write-only mode), "csv" or "parquet" (needs pyarrow,
+    written in row groups of batch_size); defaults to the output file extension.
+    force_fire / track_sections / on_error: as in transform_many.
+    workers > 1 converts shards in a process pool (see transform_parallel)
+    and writes each shard as it comes back, in input order.
+    Returns the number of rows written.
+    """
+    fmt = _export_format(output_file, fmt)
+    if workers is not None and workers > 1:
+        shards = _iter_parallel_shards(input_lines, workers, SHARD_SIZE, force_fire, track_sections, on_error)
+        rows = (
+            row
+            for columns in shards
+            for row in zip(columns["Text"], columns["Hareb Code"], columns["Quantity"])
+        )
+    else:
+        rows = iter_rows(input_lines, force_fire=force_fire, track_sections=track_sections, on_error=on_error)
+    written = _write_rows(rows, output_file, fmt, batch_size)
+
+    print(f"✅ {fmt.upper()} file created: {output_file} ({written} rows)")
+    return written
+
+
+def export_sheet(sheet_file, output_file, fmt=None, batch_size=EXPORT_BATCH_SIZE,
+                 force_fire=False, track_sections=True, on_error=_print_skipped, stats=None):
+    """
+    Streaming export of a BOQ spreadsheet (see iter_convert_sheet): each
+    converted chunk is written before the next one is read.
+    fmt is the output format, as in export_rows. Returns the number of rows written.
+    - stats: optional dict, "sheet_rows" is set to the number of sheet rows read
+    """
+    fmt = _export_format(output_file, fmt)
+    frames = iter_convert_sheet(
+        sheet_file, force_fire=force_fire, track_sections=track_sections, on_error=on_error, stats=stats,
+    )
+    rows = (
+        row
+        for df in frames
+        for row in zip(df["Text"], df["Hareb Code"], df["Quantity"])
+    )
+    written = _write_rows(rows, output_file, fmt, batch_size)
+
+    print(f"✅ {fmt.upper()} file created: {output_file} ({written} rows)")
+    return written
+
+
+def _export_format(output_file, fmt):
+    fmt = (fmt or os.path.splitext(output_file)[1].lstrip(".") or "xlsx").lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt} (expected one of {', '.join(EXPORT_FORMATS)})")
+    return fmt
+
+
+def _write_rows(rows, output_file, fmt, batch_size):
+    if fmt == "xlsx":
+        return _write_xlsx(rows, output_file)
+    if fmt == "csv":
+        return _write_csv(rows, output_file)
+    return _write_parquet(rows, output_file, batch_size)
+
+
+def _export_values(rows):
+    # Numeric quantities (Rows) or already formatted ones (DataFrames)
+    for text, code, quantity in rows:
+        yield text, "item", code, quantity if isinstance(quantity, str) else format_quantity(quantity)
+
+
+def _write_xlsx(rows, output_file):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(OUTPUT_COLUMNS)
+
+    written = 0
+    try:
+        for values in _export_values(rows):
+            ws.append(values)
+            written += 1
+    except BaseException:
+        # Finish the sheet's temp file so openpyxl does not fail again on cleanup
+        ws.close()
+        raise
+
+    wb.save(output_file)
+    return written
+
+
+def _write_csv(rows, output_file):
+    written = 0
+    with open(output_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(OUTPUT_COLUMNS)
+        for values in _export_values(rows):
+            writer.writerow(values)
+            written += 1
+    return written
+
+
+def _write_parquet(rows, output_file, batch_size):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow") from e
+
+    schema = pa.schema([(name, pa.string()) for name in OUTPUT_COLUMNS])
+    values = _export_values(rows)
+    written = 0
+    with pq.ParquetWriter(output_file, schema) as writer:
+        while True:
+            batch = list(islice(values, batch_size))
+            if not batch:
+                break
+            writer.write_table(pa.table(dict(zip(OUTPUT_COLUMNS, zip(*batch))), schema=schema))
+            written += len(batch)
+    return written
+
+
+def rows_to_frame(rows):
+    """
+    DataFrame (export formatting) from compact Rows.
+    """
+    import pandas as pd
+
+    texts, codes, quantities = [], [], []
+    for text, code, quantity in rows:
+        texts.append(text)
+        codes.append(code)
+        quantities.append(format_quantity(quantity))
+
+    with metrics.timed("convert.dataframe_seconds"):
+        return pd.DataFrame({
+            "Text": texts,
+            "Item": ["item"] * len(texts),
+            "Hareb Code": codes,
+            "Quantity": quantities,
+        })
+
+
+def iter_text_lines(uploaded_file, encoding="utf-8"):
+    """
+    Decode an uploaded binary file incrementally and yield its lines.
+    Splits lines the same way str.splitlines() does, without ever holding
+    the whole file (bytes or text) in memory.
+    """
+    wrapper = io.TextIOWrapper(uploaded_file, encoding=encoding, newline="")
+    try:
+        for chunk in wrapper:
+            yield from chunk.splitlines()
+    finally:
+        # Leave the caller's file open
+        wrapper.detach()
+
 
-def convert_text_file(uploaded_file):
+def convert_text_file(uploaded_file, workers=None):
     """
     Used by Streamlit.
     Accepts uploaded TXT file and returns DataFrame.
+    workers > 1 converts in a process pool (see transform_parallel).
     """
+    import pandas as pd
 
-    content = uploaded_file.read().decode("utf-8")
-    lines = content.splitlines()
+    lines = iter_text_lines(uploaded_file)
 
-    all_rows = []
-    fire_mode = False
+    columns = _transform_lines(lines, workers)
 
-    for line in lines:
-        line = line.strip()
-        if not line:
+    with metrics.timed("convert.dataframe_seconds"):
+        df = pd.DataFrame(columns)
+    return df
+
+
+def iter_convert_text_file(uploaded_file, batch_size=10_000):
+    """
+    Streaming version of convert_text_file.
+    Yields DataFrames of about batch_size rows while the file is still being read,
+    carrying the fire / standard section state from one batch to the next.
+    """
+    import pandas as pd
+
+    lines = iter_text_lines(uploaded_file)
+
+    for columns in iter_transform_batches(lines, batch_size, track_sections=True, on_error=_print_skipped):
+        with metrics.timed("convert.dataframe_seconds"):
+            df = pd.DataFrame(columns)
+        yield df
+
+
+# =========================================================
+# SPREADSHEET INPUT (xlsx / csv)
+# =========================================================
+# BOQ spreadsheets are read in chunks (openpyxl read-only mode for xlsx,
+# pandas chunksize for csv). The description / unit / quantity columns go
+# straight to the batch conversion: no LLM pass and no text file round trip.
+
+SHEET_FORMATS = ("xlsx", "csv")
+
+# Sheet rows converted per chunk
+SHEET_CHUNK_SIZE = 10_000
+
+# Leading rows used to find the header row and guess the columns
+SHEET_SAMPLE_ROWS = 50
+
+DESCRIPTION_HEADERS = ("description", "desc", "particulars", "details", "specification", "item")
+UNIT_HEADERS = ("unit", "units", "uom")
+QUANTITY_HEADERS = ("qty", "quantity", "quantities", "qnty", "qnt")
+
+# Cell values that mark a unit column when there is no header row
+UNIT_VALUES = {
+    "m", "lm", "ml", "mr", "rm", "mtr", "mtrs", "meter", "meters", "metre", "metres",
+    "roll", "rolls", "box", "nos", "no", "pcs",
+}
+
+HEADER_CELL_RE = re.compile(r"[^a-z]+")
+THOUSANDS_RE = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?")
+
+
+class SheetColumns(NamedTuple):
+    """
+    Column indexes (0-based) of a BOQ sheet. header_row is the index of the
+    header row among the sheet rows, or None when the columns were guessed
+    from the cell contents.
+    """
+    description: int
+    unit: Optional[int]
+    quantity: int
+    header_row: Optional[int]
+
+
+def sheet_format(uploaded_file, fmt=None):
+    """
+    "xlsx" or "csv", from fmt or the file name (path or uploaded file .name).
+    """
+    name = uploaded_file if isinstance(uploaded_file, str) else getattr(uploaded_file, "name", "")
+    fmt = (fmt or os.path.splitext(name or "")[1].lstrip(".")).lower()
+    if fmt in ("xlsm", "xltx", "xltm"):
+        fmt = "xlsx"
+    if fmt in ("txt", "tsv"):
+        fmt = "csv"
+    if fmt not in SHEET_FORMATS:
+        raise ValueError(f"Unsupported spreadsheet format: {fmt or '?'} (expected one of {', '.join(SHEET_FORMATS)})")
+    return fmt
+
+
+def iter_sheet_rows(uploaded_file, fmt=None, sheet_name=None, encoding="utf-8"):
+    """
+    Yield the rows of a spreadsheet as tuples of cell values, reading in
+    chunks so memory stays bounded.
+    - xlsx: openpyxl read-only mode; sheet_name defaults to the active sheet
+    - csv: pandas chunksize, every cell read as a string; the delimiter
+      (, ; tab |) is sniffed from the start of the file
+    """
+    fmt = sheet_format(uploaded_file, fmt)
+    if fmt == "xlsx":
+        yield from _iter_xlsx_rows(uploaded_file, sheet_name)
+    else:
+        yield from _iter_csv_rows(uploaded_file, encoding)
+
+
+def _iter_xlsx_rows(uploaded_file, sheet_name):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.active
+        yield from ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _iter_csv_rows(uploaded_file, encoding):
+    import pandas as pd
+
+    delimiter, width = _csv_layout(uploaded_file, encoding)
+    chunks = pd.read_csv(
+        uploaded_file,
+        sep=delimiter,
+        header=None,
+        names=range(width),
+        dtype=str,
+        keep_default_na=False,
+        skip_blank_lines=False,
+        encoding=encoding,
+        on_bad_lines="warn",
+        chunksize=SHEET_CHUNK_SIZE,
+    )
+    for chunk in chunks:
+        yield from chunk.itertuples(index=False, name=None)
+
+
+def _csv_layout(uploaded_file, encoding, sample_bytes=64 * 1024):
+    """
+    (delimiter, number of columns) from the first sample_bytes of a csv file.
+    Leaves an uploaded file at the position it was in.
+    """
+    if isinstance(uploaded_file, str):
+        with open(uploaded_file, "rb") as f:
+            sample = f.read(sample_bytes)
+    else:
+        pos = uploaded_file.tell()
+        sample = uploaded_file.read(sample_bytes)
+        uploaded_file.seek(pos)
+
+    text = sample.decode(encoding, errors="ignore")
+    if len(sample) == sample_bytes:
+        # Drop the (probably cut) last line
+        text = text[: text.rfind("\n") + 1] or text
+
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=",;\t|").delimiter
+    except csv.Error:
+        delimiter = ","
+
+    width = max((len(row) for row in csv.reader(io.StringIO(text), delimiter=delimiter)), default=1)
+    return delimiter, max(width, 1)
+
+
+def detect_sheet_columns(rows):
+    """
+    Find the description / unit / quantity columns in the leading rows of a sheet.
+
+    A header row is found by its titles ("Description", "Unit", "Qty", ...).
+    Without one, the columns are guessed from the contents: description is the
+    column with the most text, quantity the first mostly-numeric column after
+    it, unit a column of unit words (m, LM, MR, ...).
+    Raises ValueError when no description / quantity column can be found.
+    """
+    rows = [tuple(row) for row in rows]
+
+    for index, row in enumerate(rows):
+        columns = _header_columns(row)
+        if columns is not None:
+            description, unit, quantity = columns
+            return SheetColumns(description, unit, quantity, index)
+
+    width = max((len(row) for row in rows), default=0)
+    text_cells = [0] * width
+    number_cells = [0] * width
+    unit_cells = [0] * width
+    for row in rows:
+        for i, value in enumerate(row):
+            cell = _cell_text(value)
+            if not cell:
+                continue
+            if cell.lower().rstrip(".") in UNIT_VALUES:
+                unit_cells[i] += 1
+            elif _cell_quantity(value) is not None:
+                number_cells[i] += 1
+            elif sum(ch.isalpha() for ch in cell) >= 3:
+                text_cells[i] += 1
+
+    if not any(text_cells):
+        raise ValueError("No description column found in the spreadsheet")
+    description = max(range(width), key=lambda i: text_cells[i])
+
+    filled = max(text_cells[description], 1)
+    quantity = next(
+        (i for i in range(description + 1, width) if number_cells[i] * 2 >= filled),
+        None,
+    )
+    if quantity is None:
+        raise ValueError("No quantity column found in the spreadsheet")
+
+    unit = max(range(width), key=lambda i: unit_cells[i])
+    if not unit_cells[unit] or unit in (description, quantity):
+        unit = None
+
+    return SheetColumns(description, unit, quantity, None)
+
+
+def _header_columns(row):
+    """
+    (description, unit, quantity) indexes if row is a header row, else None.
+    """
+    titles = [HEADER_CELL_RE.sub(" ", str(value).lower()).strip() if value is not None else "" for value in row]
+
+    def find(names):
+        for name in names:
+            for i, title in enumerate(titles):
+                if title == name or title.startswith(name + " "):
+                    return i
+        return None
+
+    description = find(DESCRIPTION_HEADERS)
+    quantity = find(QUANTITY_HEADERS)
+    if description is None or quantity is None:
+        return None
+    return description, find(UNIT_HEADERS), quantity
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return format_size(value)
+    return str(value).strip()
+
+
+def _cell_quantity(value):
+    """
+    Float quantity of a cell, None when it is empty or not a number.
+    Accepts "1,200.5" (thousands separators) and "12,5" (decimal comma).
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if value != value else float(value)
+
+    text = str(value).strip().replace(" ", "")
+    if THOUSANDS_RE.fullmatch(text):
+        text = text.replace(",", "")
+    elif text.count(",") == 1 and "." not in text:
+        text = text.replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def iter_convert_sheet(uploaded_file, fmt=None, columns=None, sheet_name=None, force_fire=False,
+                       chunk_size=SHEET_CHUNK_SIZE, on_error=_print_skipped, track_sections=True, stats=None):
+    """
+    Convert a BOQ spreadsheet (xlsx / csv) chunk by chunk.
+    Yields one DataFrame (OUTPUT_COLUMNS) per chunk of about chunk_size sheet rows.
+
+    - columns: SheetColumns to use; detected from the first rows when None
+    - force_fire: initial mode; with track_sections, section header rows
+      (e.g. "Fire resistant cables") switch between fire / standard like in a text file
+    - rows without a description are skipped; rows with a description but no
+      numeric quantity (other than section headers) go to on_error
+    - stats: optional dict, "sheet_rows" counts the sheet rows read (after the header)
+    Emits "convert.sheet_rows" (rows read per chunk) to metrics hooks.
+    """
+    import pandas as pd
+
+    rows = iter_sheet_rows(uploaded_file, fmt, sheet_name)
+    sample = list(islice(rows, SHEET_SAMPLE_ROWS))
+    if columns is None:
+        columns = detect_sheet_columns(sample)
+
+    start = columns.header_row + 1 if columns.header_row is not None else 0
+    rows = chain(sample[start:], rows)
+
+    fire_mode = force_fire
+    shapes = {}
+    if stats is not None:
+        stats["sheet_rows"] = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        if stats is not None:
+            stats["sheet_rows"] += len(chunk)
+        if metrics.hooks:
+            metrics.emit("convert.sheet_rows", len(chunk))
+
+        converted = _empty_columns()
+        fire_mode = _convert_sheet_rows(chunk, columns, fire_mode, track_sections, on_error, shapes, converted)
+        if converted["Text"]:
+            yield pd.DataFrame(converted)
+
+
+def _convert_sheet_rows(chunk, columns, fire_mode, track_sections, on_error, shapes, out):
+    """
+    Convert sheet rows into the out columns; returns the fire mode after them.
+
+    The quantity cell is the length: rows resolve as their normalized
+    "description unit" shape plus that value (ConversionCache.resolve_shape),
+    never re-parsed from text. Fire / standard is tracked per row.
+    - shapes: {(description, unit): normalized shape} memo shared across chunks
+    """
+    for row in chunk:
+        description = _cell_text(row[columns.description]) if columns.description < len(row) else ""
+        if not description:
             continue
+        value = row[columns.quantity] if columns.quantity < len(row) else None
+        quantity = _cell_quantity(value)
 
-        # -----------------------------------------
-        # Detect section change
-        # -----------------------------------------
-        if is_new_cable_section(line):
+        if quantity is None and is_new_cable_section(description):
+            # Section header rows switch the mode for the rows below
+            if track_sections:
+                fire_mode = is_fire_header(description)
+            continue
 
-            if is_fire_header(line):
-                fire_mode = True
-            else:
-                fire_mode = False
+        unit = ""
+        if columns.unit is not None and columns.unit < len(row):
+            unit = _cell_text(row[columns.unit])
 
+        if quantity is None:
+            error = ValueError(f"No numeric quantity: {value!r}")
+            if on_error is None:
+                raise error
+            cell = _cell_text(value) if value == value else ""
+            on_error(" ".join(filter(None, (description, unit, cell))), error)
             continue
 
+        shape = shapes.get((description, unit))
+        if shape is None:
+            if len(shapes) >= NORMALIZE_MEMO_SIZE:
+                shapes.clear()
+            shape = normalize_text(f"{description} {unit}" if unit else description)
+            shapes[(description, unit)] = shape
+
         try:
-            all_rows.extend(transform_to_rows(line, force_fire=fire_mode))
+            _append_shape_rows(out, shape, quantity, fire_mode)
         except Exception as e:
-            print(f"Skipped: {line} | Error: {e}")
+            if on_error is None:
+                raise
+            on_error(" ".join(filter(None, (description, unit, format_size(quantity)))), e)
+
+    return fire_mode
 
-    df = pd.DataFrame(all_rows)
-    return df
 
+def _append_shape_rows(out, shape, quantity, force_fire):
+    """
+    Resolve a normalized line shape with its quantity value and append the
+    output rows to the out columns.
+    """
+    template = CONVERSION_CACHE.resolve_shape(shape, quantity, force_fire)
+    text = f"{shape} {format_size(quantity)}"
+    for code, rule, earth_size in template:
+        out["Text"].append(text)
+        out["Item"].append("item")
+        out["Hareb Code"].append(code)
+        out["Quantity"].append(_quantity(rule, earth_size, quantity))
 
 
+def convert_sheet(uploaded_file, fmt=None, columns=None, sheet_name=None, force_fire=False,
+                  on_error=_print_skipped):
+    """
+    Used by Streamlit.
+    Accepts an uploaded XLSX / CSV BOQ and returns DataFrame (see iter_convert_sheet).
+    """
+    import pandas as pd
 
+    frames = list(iter_convert_sheet(uploaded_file, fmt, columns, sheet_name, force_fire, on_error=on_error))
+    if not frames:
+        return pd.DataFrame(_empty_columns())
 
+    with metrics.timed("convert.dataframe_seconds"):
+        return pd.concat(frames, ignore_index=True)
 
 
+def convert_series(descriptions, quantities=None, force_fire=False, on_error=None):
+    """
+    Convert a whole column of BOQ descriptions (pandas Series) at once.
+
+    - quantities: optional Series aligned with descriptions, the length of
+      each row as a value (number or numeric text, see _cell_quantity).
+      Descriptions are then line shapes without their quantity ("4x16 mm2 M")
+      and resolve like spreadsheet rows (ConversionCache.resolve_shape): the
+      quantity is never parsed back out of text
+    - without quantities every description is a complete line, as in transform_many
+    - force_fire / on_error: as in transform_many; a row with a description
+      but no numeric quantity is an error too
+    Returns a DataFrame with OUTPUT_COLUMNS, in input order.
+    """
+    import pandas as pd
+
+    # One conversion to Python objects: iterating an (Arrow backed) Series is slow
+    texts = [
+        "" if value is None or value is pd.NA or value != value else _cell_text(value)
+        for value in descriptions.tolist()
+    ]
+    if quantities is None:
+        return pd.DataFrame(transform_many(texts, force_fire=force_fire, on_error=on_error))
+
+    out = _empty_columns()
+    shapes = {}
+    for description, value in zip(texts, quantities.tolist()):
+        if not description:
+            continue
+        quantity = _cell_quantity(value)
+        try:
+            if quantity is None:
+                raise ValueError(f"No numeric quantity: {value!r}")
+            shape = shapes.get(description)
+            if shape is None:
+                if len(shapes) >= NORMALIZE_MEMO_SIZE:
+                    shapes.clear()
+                shape = shapes[description] = normalize_text(description)
+            _append_shape_rows(out, shape, quantity, force_fire)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(f"{description} {value}", e)
 
+    with metrics.timed("convert.dataframe_seconds"):
+        return pd.DataFrame(out)
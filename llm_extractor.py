@@ -1,14 +1,47 @@
-from openai import OpenAI
+import hashlib
+import heapq
 import json
 import os
+import random
 import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-client = OpenAI(
-    api_key=GROQ_API_KEY,
-    base_url="https://api.groq.com/openai/v1"
-)
+# Point LLM_BASE_URL at a local stand-in server for tests / benchmarks
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))                 # seconds, whole request
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 10))  # seconds
+
+# Retries on 429 / 5xx / connection errors: exponential backoff with full jitter
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 4))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))      # seconds
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 20))         # seconds
+
+# Process-wide provider limits shared by every session (0 = unlimited)
+LLM_REQUESTS_PER_MIN = int(os.getenv("LLM_REQUESTS_PER_MIN", 30))
+LLM_TOKENS_PER_MIN = int(os.getenv("LLM_TOKENS_PER_MIN", 6000))
+
+# Scheduler priorities: lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+MODEL = "llama-3.1-8b-instant"
+
+# Persistent extraction cache (set LLM_CACHE_PATH="" to disable)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))   # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 5000))
+
+# Long pastes are split into chunks of about this many characters,
+# extracted concurrently (at most LLM_MAX_CONCURRENCY requests at a time)
+LLM_CHUNK_CHARS = int(os.getenv("LLM_CHUNK_CHARS", 6000))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 4))
 
 SYSTEM_PROMPT = """
 You are a BOQ (Bill of Quantities) structure extraction engine.
@@ -73,6 +106,14 @@ then set is_fire_section=true for ALL following items until another cable sectio
 
 If a row itself contains fire keywords, that item must have is_fire_section=true.
 
+============================================================
+BLOCK IDS
+============================================================
+Some lines may start with a block id like [#12].
+Every item extracted from that line, or from the sub-rows below it, gets
+"block": 12 (the number only). Never copy the id into description or raw_text.
+If the input has no block ids, use "block": null.
+
 ============================================================
 OUTPUT FORMAT (STRICT)
 ============================================================
@@ -86,7 +127,8 @@ Each item MUST contain exactly these fields:
   "color": null or "...",
   "unit": null or "...",
   "quantity": number,
-  "is_fire_section": boolean
+  "is_fire_section": boolean,
+  "block": null or number
 }
 
 Rules:
@@ -102,11 +144,15 @@ Rules:
 #########################################
 #########################################
 
+_FENCE_OPEN_RE = re.compile(r"^```(?:json)?", re.IGNORECASE)
+_FENCE_CLOSE_RE = re.compile(r"```$")
+_CONTROL_CHARS_RE = re.compile(r"[\x00-\x1F\x7F]")
+
 def _strip_code_fences(s: str) -> str:
     s = s.strip()
     if s.startswith("```"):
-        s = re.sub(r"^```(?:json)?", "", s.strip(), flags=re.IGNORECASE).strip()
-        s = re.sub(r"```$", "", s.strip()).strip()
+        s = _FENCE_OPEN_RE.sub("", s.strip()).strip()
+        s = _FENCE_CLOSE_RE.sub("", s.strip()).strip()
     return s
 
 def _extract_json_array(s: str) -> str:
@@ -122,122 +168,805 @@ def _remove_control_chars_outside_strings(s: str) -> str:
     Removes ASCII control chars globally. This is a blunt tool.
     Keep it, but we’ll also add a smarter sanitizer below.
     """
-    return re.sub(r"[\x00-\x1F\x7F]", "", s)
+    return _CONTROL_CHARS_RE.sub("", s)
 
 
-def _sanitize_json_control_chars(s: str) -> str:
-    """
-    Fix common LLM JSON issues:
-    - raw newlines/tabs inside quoted strings
-    - other control chars inside strings
+# A JSON string literal, escapes included; an unterminated one runs to the end of the text
+_JSON_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*(?:"|\\?\Z)'
 
-    We do NOT try to "engineer" anything. We only make JSON parseable.
-    """
-    out = []
-    in_str = False
-    esc = False
+# String literals (kept, repaired) or control chars outside strings (dropped)
+_SANITIZE_RE = re.compile(_JSON_STRING + r'|[\x00-\x1f]', re.DOTALL)
 
-    for ch in s:
-        if in_str:
-            if esc:
-                # keep escaped char as-is
-                out.append(ch)
-                esc = False
-                continue
+# Inside a string: an escape pair (kept as-is) or a raw control char (repaired)
+_STRING_FIX_RE = re.compile(r'\\.|[\x00-\x1f]', re.DOTALL)
+_HAS_CONTROL_RE = re.compile(r'[\x00-\x1f]')
 
-            if ch == "\\":
-                out.append(ch)
-                esc = True
-                continue
+# JSON strings cannot contain raw newlines or tabs; other control chars become a space
+_STRING_CONTROL_MAP = {chr(i): " " for i in range(32)}
+_STRING_CONTROL_MAP.update({"\n": "\\n", "\r": "\\n", "\t": "\\t"})
+_STRING_CONTROL_TABLE = str.maketrans(_STRING_CONTROL_MAP)
 
-            # JSON strings cannot contain raw newlines or tabs.
-            if ch == "\n" or ch == "\r":
-                out.append("\\n")
-                continue
-            if ch == "\t":
-                out.append("\\t")
-                continue
+# Tokens that matter for object nesting: string literals and braces
+_STRUCTURE_RE = re.compile(_JSON_STRING + r'|[{}]', re.DOTALL)
 
-            # Other ASCII control chars inside strings → replace with space
-            if ord(ch) < 32:
-                out.append(" ")
-                continue
 
-            if ch == '"':
-                in_str = False
-                out.append(ch)
-                continue
+def _fix_string_char(m):
+    token = m.group()
+    # keep escaped char as-is
+    return token if len(token) == 2 else _STRING_CONTROL_MAP[token]
 
-            out.append(ch)
-        else:
-            if ch == '"':
-                in_str = True
-                out.append(ch)
-                continue
 
-            # Outside strings, remove control chars outright
-            if ord(ch) < 32:
-                continue
+def _sanitize_token(m):
+    token = m.group()
+    if token[0] != '"':
+        # Outside strings, remove control chars outright
+        return ""
+    if not _HAS_CONTROL_RE.search(token):
+        return token
+    if "\\" not in token:
+        return token.translate(_STRING_CONTROL_TABLE)
+    return _STRING_FIX_RE.sub(_fix_string_char, token)
+
 
-            out.append(ch)
+def _sanitize_json_control_chars(s: str) -> str:
+    """
+    Fix common LLM JSON issues:
+    - raw newlines/tabs inside quoted strings
+    - other control chars inside strings
 
-    return "".join(out)
+    We do NOT try to "engineer" anything. We only make JSON parseable.
+    Works per token (string literal / stray control char) with regexes, so
+    clean text is copied through without per-character Python work.
+    """
+    if not _HAS_CONTROL_RE.search(s):
+        return s
+    return _SANITIZE_RE.sub(_sanitize_token, s)
 
 
 def _extract_top_level_json_objects(s: str):
     """
     Salvage parser: scan text and extract substrings that look like top-level JSON objects { ... }
     respecting strings and escapes, so we don't split in the middle of a quoted string.
+    Only string literals and braces are visited, not every character.
     """
     objs = []
-    in_str = False
-    esc = False
     depth = 0
     start = None
 
-    for i, ch in enumerate(s):
-        if in_str:
-            if esc:
-                esc = False
-                continue
-            if ch == "\\":
-                esc = True
-                continue
-            if ch == '"':
-                in_str = False
-            continue
-
-        # not in string
-        if ch == '"':
-            in_str = True
-            continue
-
+    for m in _STRUCTURE_RE.finditer(s):
+        ch = m.group()
         if ch == "{":
             if depth == 0:
-                start = i
+                start = m.start()
             depth += 1
         elif ch == "}":
             if depth > 0:
                 depth -= 1
                 if depth == 0 and start is not None:
-                    objs.append(s[start:i+1])
+                    objs.append(s[start:m.end()])
                     start = None
 
     return objs
 
 
-def extract_structure_from_text(raw_text: str):
-    resp = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        temperature=0,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            # reinforce strict JSON
-            {"role": "user", "content": f"Extract structured cable items from:\n\n{raw_text}\n\nReturn STRICT JSON array only."}
-        ],
+#########################################
+# CLIENT
+#########################################
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Shared OpenAI-compatible client, created on first use.
+    Its pooled HTTP connections are reused by every request and thread.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+def configure_client(base_url=None, api_key=None):
+    """
+    Override the endpoint / key (e.g. a local stand-in server) and drop the
+    current client so the next request builds a new one.
+    """
+    global LLM_BASE_URL, GROQ_API_KEY, _client
+    with _client_lock:
+        if base_url is not None:
+            LLM_BASE_URL = base_url
+        if api_key is not None:
+            GROQ_API_KEY = api_key
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+def _build_client():
+    from openai import OpenAI, Timeout
+
+    # The client keeps one keep-alive connection pool for its lifetime
+    return OpenAI(
+        api_key=GROQ_API_KEY,
+        base_url=LLM_BASE_URL,
+        timeout=Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        # Retries are handled by _with_retries (backoff + jitter)
+        max_retries=0,
+    )
+
+
+def _is_retryable(error) -> bool:
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+def _retry_delay(error, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+def _with_retries(call):
+    """
+    Run call(), retrying 429 / 5xx / connection errors up to LLM_MAX_RETRIES times.
+    """
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            if attempt >= LLM_MAX_RETRIES or not _is_retryable(e):
+                raise
+            time.sleep(_retry_delay(e, attempt))
+            attempt += 1
+
+
+#########################################
+# REQUEST SCHEDULER
+#########################################
+
+class _TokenBucket:
+    """
+    Refills continuously at per_minute / 60 per second up to per_minute.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount is available (0 if it is now)."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        # A request bigger than the whole bucket runs once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+    def take(self, amount):
+        if self.capacity > 0:
+            self.level -= min(amount, self.capacity)
+
+
+class RequestScheduler:
+    """
+    Process-wide gate in front of every completion request:
+    - token buckets on requests/min and tokens/min
+    - priority queue: waiting requests are admitted lowest priority first
+      (FIFO within a priority)
+    - coalescing: identical requests already in flight share one result
+    """
+
+    def __init__(self, requests_per_min=LLM_REQUESTS_PER_MIN, tokens_per_min=LLM_TOKENS_PER_MIN):
+        self._requests = _TokenBucket(requests_per_min)
+        self._tokens = _TokenBucket(tokens_per_min)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = 0
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def acquire(self, tokens, priority=PRIORITY_INTERACTIVE):
+        """
+        Block until this request may be sent under both limits.
+        """
+        with self._cond:
+            self._seq += 1
+            ticket = (priority, self._seq)
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._queue[0] == ticket:
+                        now = time.monotonic()
+                        timeout = max(self._requests.wait_time(1, now), self._tokens.wait_time(tokens, now))
+                        if timeout <= 0:
+                            self._requests.take(1)
+                            self._tokens.take(tokens)
+                            return
+                    self._cond.wait(timeout)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def record_usage(self, estimated, actual):
+        """
+        Correct the tokens/min bucket once the real usage is known.
+        """
+        if actual is None:
+            return
+        with self._cond:
+            self._tokens.take(actual - estimated)
+            self._cond.notify_all()
+
+    def coalesce(self, key, call):
+        """
+        Run call() once per key at a time; concurrent callers with the same
+        key wait for and share that result (or exception).
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+
+scheduler = RequestScheduler()
+
+
+def _estimate_tokens(raw_text: str) -> int:
+    """
+    Rough request size for the tokens/min bucket: ~4 chars per token for
+    prompt + input, and about as much JSON output as input.
+    """
+    return (len(SYSTEM_PROMPT) + 2 * len(raw_text)) // 4 + 50
+
+
+def _scheduled_create(llm_client, raw_text: str, priority: int, **kwargs):
+    """
+    Rate-limited, retried chat completion.
+    """
+    estimated = _estimate_tokens(raw_text)
+
+    def attempt():
+        with metrics.timed("llm.queue_wait_seconds"):
+            scheduler.acquire(estimated, priority)
+        with metrics.timed("llm.request_seconds", stream=bool(kwargs.get("stream"))):
+            return llm_client.chat.completions.create(
+                model=MODEL,
+                temperature=0,
+                messages=_messages(raw_text),
+                **kwargs,
+            )
+
+    with metrics.timed("llm.round_trip_seconds"):
+        resp = _with_retries(attempt)
+
+    usage = getattr(resp, "usage", None)
+    scheduler.record_usage(estimated, getattr(usage, "total_tokens", None))
+    if usage is not None and metrics.hooks:
+        metrics.emit("llm.prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        metrics.emit("llm.completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+    return resp
+
+
+#########################################
+# EXTRACTION CACHE
+#########################################
+
+class ExtractionCache:
+    """
+    Content-addressed SQLite store for cleaned extraction results.
+
+    Key: sha256 of (model, SYSTEM_PROMPT, input text), so changing the
+    prompt or the model never serves stale items.
+    Entries older than ttl seconds are ignored and purged; the store keeps
+    at most max_entries rows (least recently used are evicted first).
+    """
+
+    def __init__(self, path, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._ready = False
+
+    @staticmethod
+    def make_key(raw_text: str, model: str = MODEL, system_prompt: str = SYSTEM_PROMPT) -> str:
+        payload = json.dumps([model, system_prompt, raw_text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._ready:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                " key TEXT PRIMARY KEY,"
+                " items TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " used REAL NOT NULL)"
+            )
+            conn.commit()
+            self._ready = True
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT items, created FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE extractions SET used = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return json.loads(row[0])
+        finally:
+            conn.close()
+
+    def put(self, key: str, items):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, items, created, used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(items, ensure_ascii=False), now, now),
+            )
+            # TTL + size eviction
+            conn.execute("DELETE FROM extractions WHERE created < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM extractions WHERE key NOT IN "
+                "(SELECT key FROM extractions ORDER BY used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM extractions")
+            conn.commit()
+        finally:
+            conn.close()
+
+
+extraction_cache = ExtractionCache(LLM_CACHE_PATH) if LLM_CACHE_PATH else None
+
+
+#########################################
+# CHUNKING
+#########################################
+
+# Words that only ever appear on BLOCK FORMAT sub-rows (no, color, unit, qty)
+_UNIT_WORDS = {
+    "roll", "rolls", "coil", "coils", "m", "ml", "lm", "mr", "meter", "meters", "metre", "metres",
+    "pcs", "pc", "nos", "each", "ea", "lot",
+}
+
+_ATTRIBUTE_WORDS = {
+    "red", "yellow", "black", "blue", "brown", "grey", "gray", "white", "orange", "green",
+    "rd", "yl", "bk", "bl", "bu", "br", "gy", "wt", "or", "gn",
+    "no",
+} | _UNIT_WORDS
+
+_TOKEN_RE = re.compile(r"[a-z]+|\d+(?:[.,]\d+)?")
+_DIGIT_RE = re.compile(r"\d")
+# Block id tag of extract_structure_from_groups ("[#3] Cable NYA 4mm2")
+_BLOCK_ID_RE = re.compile(r"\[#\d+\]\s*")
+
+
+def _is_attribute_line(line: str) -> bool:
+    """
+    True for blank lines and sub-rows made only of numbers, colors and units
+    ("1", "RED", "Roll", "2 Yellow Roll 5"). These belong to the item above
+    them, so a chunk must never start on one.
+    """
+    tokens = _TOKEN_RE.findall(line.lower())
+    return all(t in _ATTRIBUTE_WORDS or t[0].isdigit() for t in tokens)
+
+
+def _split_blocks(raw_text: str):
+    """
+    Group lines into blocks: a header/row line plus the attribute sub-rows
+    that follow it. Leading attribute lines form their own block.
+    """
+    blocks = []
+    current = []
+    for line in raw_text.splitlines():
+        if current and not _is_attribute_line(line):
+            blocks.append(current)
+            current = []
+        current.append(line)
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def split_into_chunks(raw_text: str, max_chars: int = LLM_CHUNK_CHARS):
+    """
+    Split BOQ text into chunks of about max_chars without breaking a BLOCK
+    FORMAT header/sub-row group (a single oversized group stays whole).
+
+    Section context is preserved: a chunk that starts inside a section gets
+    the last section header (a descriptive line without numbers, e.g.
+    "Fire resistant cables") repeated on top, so fire detection still works.
+    Text that fits in one chunk is returned unchanged; chunks without any
+    number (headers only, nothing to extract) are dropped.
+    """
+    if len(raw_text) <= max_chars:
+        return [raw_text]
+
+    chunks = []
+    current = []
+    size = 0
+    section_header = None
+    chunk_header = None
+
+    for block in _split_blocks(raw_text):
+        block_text = "\n".join(block)
+        if current and size + len(block_text) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current = [chunk_header] if chunk_header else []
+            size = len(chunk_header) + 1 if chunk_header else 0
+
+        current.append(block_text)
+        size += len(block_text) + 1
+
+        head = _BLOCK_ID_RE.sub("", block[0]).strip()
+        if head and not _DIGIT_RE.search(head):
+            section_header = head
+        chunk_header = section_header
+
+    if current:
+        chunks.append("\n".join(current))
+
+    # Items need a numeric quantity: a chunk with no digits at all is only headers
+    return [chunk for chunk in chunks if _DIGIT_RE.search(chunk)]
+
+
+def split_row_lines(raw_text: str, is_row):
+    """
+    Separate lines the caller can convert without the LLM from the rest.
+
+    Returns segments in input order:
+    - ("row", line): a self-contained line accepted by is_row (a line that
+      heads BLOCK FORMAT sub-rows is never taken, even if is_row accepts it)
+    - ("text", text): one block (a header plus its sub-rows) to send to the
+      LLM, with the lines without any number just above it (section
+      headers) kept on top as context; those lines alone are dropped
+    Each block is its own segment, so editing a line only changes its block.
+    """
+    segments = []
+    context = []
+
+    for block in _split_blocks(raw_text):
+        head = block[0]
+        if all(not line.strip() for line in block[1:]) and is_row(head):
+            context.clear()
+            segments.append(("row", head.strip()))
+        elif not any(_DIGIT_RE.search(line) for line in block):
+            context.extend(block)
+        else:
+            segments.append(("text", "\n".join(context + block)))
+            context.clear()
+
+    return segments
+
+
+def extract_structure_from_text(raw_text: str, llm_client=None, cache=None,
+                                max_chunk_chars: int = LLM_CHUNK_CHARS,
+                                max_concurrency: int = LLM_MAX_CONCURRENCY,
+                                priority: int = PRIORITY_INTERACTIVE):
+    """
+    Extract structured cable items from raw BOQ text.
+
+    - llm_client: OpenAI-compatible client (defaults to get_client())
+    - cache: ExtractionCache to use (defaults to extraction_cache; pass False to bypass)
+    - max_chunk_chars / max_concurrency: long input is split with split_into_chunks()
+      and the chunks are extracted concurrently; items come back in input order
+    - priority: scheduler priority (PRIORITY_INTERACTIVE / PRIORITY_BATCH)
+    """
+    chunks = split_into_chunks(raw_text, max_chunk_chars)
+    if not chunks:
+        return []
+    if len(chunks) == 1:
+        return _extract_chunk(chunks[0], llm_client, cache, priority)
+
+    workers = max(1, min(max_concurrency, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(metrics.in_context(lambda chunk: _extract_chunk(chunk, llm_client, cache, priority)), chunks)
+        return [item for items in results for item in items]
+
+
+def extract_structure_from_groups(groups, llm_client=None, cache=None,
+                                  max_chunk_chars: int = LLM_CHUNK_CHARS,
+                                  max_concurrency: int = LLM_MAX_CONCURRENCY,
+                                  priority: int = PRIORITY_INTERACTIVE):
+    """
+    Extract several pieces of BOQ text (e.g. the parts of a paste that need
+    the LLM) with a single extract_structure_from_text call on the joined
+    text, and return the items of each piece.
+
+    Returns (items per group, exact). Every block line of group i is
+    tagged "[#i]" and the model echoes the id back in each item's "block"
+    field (see SYSTEM_PROMPT), so items go to the group they came from. An
+    item without a valid id stays with the group of the item before it.
+    exact is True when every item had a valid id and every group got as
+    many items as it has item lines (_expected_items); otherwise the split
+    is fine to show but not to keep per group.
+    """
+    if not groups:
+        return [], True
+    tagged = [_tag_blocks(text, i) for i, text in enumerate(groups)]
+    items = extract_structure_from_text(
+        "\n".join(tagged), llm_client, cache, max_chunk_chars, max_concurrency, priority,
     )
+    return _assign_items(items, groups)
+
+
+def _tag_blocks(text: str, block_id: int) -> str:
+    """
+    Prefix the first line of every block in text with its block id, so the
+    id survives however the joined text is chunked.
+    """
+    lines = []
+    for block in _split_blocks(text):
+        lines.append(f"[#{block_id}] {block[0]}")
+        lines.extend(block[1:])
+    return "\n".join(lines)
+
+
+def _assign_items(items, groups):
+    expected = [_expected_items(text) for text in groups]
+    assigned = [[] for _ in groups]
+
+    exact = True
+    g = 0
+    for item in items:
+        block = item.get("block")
+        if block is not None and 0 <= block < len(groups):
+            g = block
+        else:
+            exact = False
+        assigned[g].append(item)
+
+    exact = exact and all(len(a) == e for a, e in zip(assigned, expected))
+    return assigned, exact
+
+
+def _expected_items(text: str) -> int:
+    """
+    Items the model should return for the text, per block:
+    - sub-rows with units: one item per quantity, the first number after a
+      unit (as in SYSTEM_PROMPT); item numbers ("1", "2") are not items,
+      whether on their own line or in front ("2 Yellow Roll 5")
+    - sub-rows without units: one item per sub-row with a number
+    - no numbered sub-rows: the block's own line
+    """
+    count = 0
+    for block in _split_blocks(text):
+        sub_rows = block[1:]
+        quantities = 0
+        after_unit = False
+        for line in sub_rows:
+            for token in _TOKEN_RE.findall(line.lower()):
+                if token in _UNIT_WORDS:
+                    after_unit = True
+                elif token[0].isdigit() and after_unit:
+                    quantities += 1
+                    after_unit = False
+
+        if not quantities:
+            quantities = sum(1 for line in sub_rows if _DIGIT_RE.search(line))
+        count += quantities or (1 if _DIGIT_RE.search(block[0]) else 0)
+    return count
+
+
+def iter_structure_from_text(raw_text: str, llm_client=None, cache=None,
+                             max_chunk_chars: int = LLM_CHUNK_CHARS,
+                             priority: int = PRIORITY_INTERACTIVE):
+    """
+    Streaming version of extract_structure_from_text.
+
+    Requests the completion with stream=True and yields each cleaned item as
+    soon as its JSON object closes, so rows can be produced while the model
+    is still generating. Chunks are streamed one after the other, in order.
+    Complete results are stored in the cache like the non-streaming path.
+    """
+    for chunk in split_into_chunks(raw_text, max_chunk_chars):
+        yield from _stream_chunk(chunk, llm_client, cache, priority)
+
+
+def _stream_chunk(raw_text: str, llm_client=None, cache=None, priority=PRIORITY_INTERACTIVE):
+    cache, key, cached = _cache_lookup(raw_text, cache)
+    if cached is not None:
+        yield from cached
+        return
+
+    stream = _scheduled_create(llm_client or get_client(), raw_text, priority, stream=True)
+
+    decoder = _IncrementalObjectDecoder()
+    cleaned = []
+    for event in stream:
+        if not event.choices:
+            continue
+        delta = event.choices[0].delta.content
+        if not delta:
+            continue
+        for item in decoder.feed(delta):
+            cleaned.append(item)
+            yield item
+
+    _cache_store(cache, key, cleaned)
+
+
+# String literal (group 1 set once it is closed) or a brace
+_STREAM_TOKEN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(")?|[{}]', re.DOTALL)
+
+
+class _IncrementalObjectDecoder:
+    """
+    Turns streamed text into cleaned items: every top-level JSON object is
+    sanitized, parsed and cleaned as soon as its closing brace arrives.
+    A {"items": [...]} wrapper is unpacked when it closes.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._start = None
+
+    def feed(self, text: str):
+        self._buf += text
+        items = []
+
+        for m in _STREAM_TOKEN_RE.finditer(self._buf, self._pos):
+            token = m.group()
+            if token[0] == '"':
+                if m.group(1) is None:
+                    # string still open: wait for more text
+                    break
+            elif token == "{":
+                if self._depth == 0:
+                    self._start = m.start()
+                self._depth += 1
+            elif self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    items.extend(self._decode(self._buf[self._start:m.end()]))
+                    self._start = None
+            self._pos = m.end()
+        else:
+            self._pos = len(self._buf)
+
+        # Drop text that can no longer be part of an object
+        if self._start is None:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+
+        return items
+
+    @staticmethod
+    def _decode(obj_txt):
+        try:
+            obj = json.loads(_sanitize_json_control_chars(obj_txt))
+        except Exception:
+            return []
+        if isinstance(obj, dict) and isinstance(obj.get("items"), list):
+            candidates = obj["items"]
+        else:
+            candidates = [obj]
+        return [item for item in map(_clean_item, candidates) if item is not None]
+
+
+def _extract_chunk(raw_text: str, llm_client=None, cache=None, priority=PRIORITY_INTERACTIVE):
+    cache, key, cached = _cache_lookup(raw_text, cache)
+    if cached is not None:
+        return cached
+
+    llm_client = llm_client or get_client()
+    # Identical requests in flight (other sessions, repeated chunks) share one call
+    inflight_key = (id(llm_client), key or ExtractionCache.make_key(raw_text))
+    cleaned = scheduler.coalesce(inflight_key, lambda: _request_items(raw_text, llm_client, priority))
+    cleaned = [dict(item) for item in cleaned]
+
+    _cache_store(cache, key, cleaned)
+    return cleaned
+
+
+def _cache_lookup(raw_text, cache):
+    """
+    Returns (cache, key, cached items or None).
+    """
+    if cache is None:
+        cache = extraction_cache
+
+    if not cache:
+        return cache, None, None
+
+    key = ExtractionCache.make_key(raw_text)
+    try:
+        cached = cache.get(key)
+    except sqlite3.Error:
+        # A broken cache must never block extraction
+        cached = None
+    return cache, key, cached
+
+
+def _cache_store(cache, key, cleaned):
+    # Empty results are usually a bad completion: don't pin them
+    if cache and cleaned:
+        try:
+            cache.put(key, cleaned)
+        except sqlite3.Error:
+            pass
+
+
+def _messages(raw_text: str):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        # reinforce strict JSON
+        {"role": "user", "content": f"Extract structured cable items from:\n\n{raw_text}\n\nReturn STRICT JSON array only."}
+    ]
+
+
+def _request_items(raw_text: str, llm_client, priority=PRIORITY_INTERACTIVE):
+    resp = _scheduled_create(llm_client, raw_text, priority)
 
     content = resp.choices[0].message.content or ""
+    with metrics.timed("llm.json_repair_seconds"):
+        return parse_items(content)
+
+
+def parse_items(content: str):
+    """
+    Repair and parse a raw model response into the cleaned item list.
+    """
     content = _strip_code_fences(content)
     content = _extract_json_array(content)
 
@@ -255,8 +984,8 @@ def extract_structure_from_text(raw_text: str):
     # 2) Salvage: parse object by object
     if items is None:
         salvage = []
+        # content is already sanitized (and sanitizing is idempotent)
         for obj_txt in _extract_top_level_json_objects(content):
-            obj_txt = _sanitize_json_control_chars(obj_txt)
             try:
                 salvage.append(json.loads(obj_txt))
             except Exception:
@@ -276,26 +1005,54 @@ def extract_structure_from_text(raw_text: str):
     # Clean items: skip bad ones, keep rest
     cleaned = []
     for it in items:
-        if not isinstance(it, dict):
-            continue
-        try:
-            qty = it.get("quantity", None)
-            if qty is None:
-                continue
-            qty = float(qty)
-            if qty <= 0:
-                continue
-
-            cleaned.append({
-                "description": it.get("description"),
-                "raw_text": it.get("raw_text"),
-                "size_text": it.get("size_text"),
-                "color": it.get("color"),
-                "unit": it.get("unit"),
-                "quantity": qty,
-                "is_fire_section": bool(it.get("is_fire_section", False))
-            })
-        except Exception:
-            continue
+        item = _clean_item(it)
+        if item is not None:
+            cleaned.append(item)
 
     return cleaned
+
+
+def _clean_item(it):
+    """
+    Return the item with exactly the expected fields, or None if it has no
+    usable positive quantity.
+    """
+    if not isinstance(it, dict):
+        return None
+    try:
+        qty = it.get("quantity", None)
+        if qty is None:
+            return None
+        qty = float(qty)
+        if qty <= 0:
+            return None
+
+        return {
+            "description": _strip_block_id(it.get("description")),
+            "raw_text": _strip_block_id(it.get("raw_text")),
+            "size_text": it.get("size_text"),
+            "color": it.get("color"),
+            "unit": it.get("unit"),
+            "quantity": qty,
+            "is_fire_section": bool(it.get("is_fire_section", False)),
+            "block": _block_id(it.get("block")),
+        }
+    except Exception:
+        return None
+
+
+def _strip_block_id(text):
+    # The model sometimes copies the "[#3]" tag into the text
+    return _BLOCK_ID_RE.sub("", text) if isinstance(text, str) else text
+
+
+def _block_id(value):
+    """
+    Block id echoed by the model (12, "12", "#12"), None if missing or invalid.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return int(str(value).strip(" #[]"))
+    except ValueError:
+        return None
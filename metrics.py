@@ -0,0 +1,142 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# =========================================================
+# METRICS HOOKS
+# =========================================================
+# Instrumented code calls emit(name, value, **tags). Nothing is recorded
+# unless a hook is registered, and hot paths check `hooks` first so the
+# cost is a single list truthiness test when metrics are off.
+#
+# A hook is any callable(name, value, tags). Hooks are process-wide: they
+# see events from every thread (e.g. the app's worker pools). To record
+# only one caller's events (one app session among many), use
+# recording(scoped=True) and start worker threads through in_context().
+
+hooks = []
+_hooks_lock = threading.Lock()
+
+# Set inside recording(scoped=True); events emitted from another context are not recorded
+_scope = contextvars.ContextVar("metrics_scope", default=None)
+
+
+def add_hook(hook):
+    with _hooks_lock:
+        hooks.append(hook)
+
+
+def remove_hook(hook):
+    with _hooks_lock:
+        if hook in hooks:
+            hooks.remove(hook)
+
+
+def emit(name, value, **tags):
+    for hook in list(hooks):
+        hook(name, value, tags)
+
+
+@contextmanager
+def timed(name, **tags):
+    """
+    Emit the duration (seconds) of the with-block as `name`.
+    """
+    if not hooks:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        emit(name, time.perf_counter() - start, **tags)
+
+
+class MetricsRecorder:
+    """
+    Hook that aggregates events into count / total / max per (name, tags).
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, name, value, tags):
+        key = (name, tuple(sorted(tags.items())))
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                self._stats[key] = [1, value, value]
+            else:
+                stat[0] += 1
+                stat[1] += value
+                stat[2] = max(stat[2], value)
+
+    def summary(self):
+        """
+        One dict per metric, sorted by name: metric, tags, count, total, mean, max.
+        """
+        with self._lock:
+            items = sorted(self._stats.items())
+        return [
+            {
+                "metric": name,
+                "tags": ", ".join(f"{k}={v}" for k, v in tags),
+                "count": count,
+                "total": total,
+                "mean": total / count,
+                "max": peak,
+            }
+            for (name, tags), (count, total, peak) in items
+        ]
+
+
+@contextmanager
+def recording(scoped=False):
+    """
+    Record every metric emitted inside the with-block:
+
+        with metrics.recording() as rec:
+            ...
+        rec.summary()
+
+    - scoped: only record events emitted from this context (the with-block
+      and functions run through in_context() from it), not the ones other
+      threads emit at the same time
+    """
+    recorder = MetricsRecorder()
+    hook = recorder
+    token = None
+    if scoped:
+        scope = object()
+        token = _scope.set(scope)
+
+        def hook(name, value, tags):
+            if _scope.get() is scope:
+                recorder(name, value, tags)
+
+    add_hook(hook)
+    try:
+        yield recorder
+    finally:
+        remove_hook(hook)
+        if token is not None:
+            _scope.reset(token)
+
+
+def in_context(fn):
+    """
+    fn wrapped to run in a copy of the caller's context, so a scoped
+    recording() also sees the events of worker threads:
+
+        pool.submit(metrics.in_context(work), ...)
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run